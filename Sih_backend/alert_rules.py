@@ -0,0 +1,141 @@
+import json
+import os
+
+import numpy as np
+
+# Columns of the reading matrix, same order as the model features
+METRICS = ('temperature', 'ph', 'turbidity', 'tds')
+# Index in this tuple is the severity a level evaluates to (0 = no alert)
+LEVELS = (None, 'warning', 'danger')
+OPS = ('<', '<=', '>', '>=')
+
+# JSON file with a list of rules replacing the defaults below
+ALERT_RULES_PATH = os.environ.get("ALERT_RULES_PATH")
+
+# WHO-style drinking water limits. Warning rules overlap the danger ones on
+# purpose, a reading takes the most severe level that fires
+DEFAULT_RULES = [
+    {"level": "danger", "metric": "ph", "op": "<", "value": 6.5},
+    {"level": "danger", "metric": "ph", "op": ">", "value": 8.5},
+    {"level": "danger", "metric": "turbidity", "op": ">", "value": 10},
+    {"level": "danger", "metric": "tds", "op": ">", "value": 500},
+    {"level": "warning", "metric": "turbidity", "op": ">", "value": 5},
+    {"level": "warning", "metric": "tds", "op": ">", "value": 300},
+]
+
+class RuleSet:
+    """Alert threshold rules compiled into NumPy arrays.
+
+    A rule is {"level", "metric", "op", "value"} plus optional "village" and
+    "sensor_type" scopes. Rules with the same level, metric and direction
+    (upper or lower limit) override each other: a reading uses the most
+    specific one that matches it (village and type, then village, then type,
+    then unscoped). evaluate()
+    scores N readings against all M rules as one (N, M) comparison.
+    """
+
+    def __init__(self, rules):
+        self.rules = [self._validate(rule) for rule in rules]
+        self._villages = {}
+        self._types = {}
+        keys = {}
+        metric, value, sign, inclusive, severity = [], [], [], [], []
+        village, sensor_type, specificity, key = [], [], [], []
+        for rule in self.rules:
+            metric.append(METRICS.index(rule['metric']))
+            value.append(rule['value'])
+            # x < v is -x > -v, so every comparison becomes sign * (x - v) > 0
+            sign.append(1.0 if rule['op'][0] == '>' else -1.0)
+            inclusive.append(rule['op'].endswith('='))
+            severity.append(LEVELS.index(rule['level']))
+            village.append(self._code(self._villages, rule.get('village')))
+            sensor_type.append(self._code(self._types, rule.get('sensor_type')))
+            specificity.append(2 * (rule.get('village') is not None) + (rule.get('sensor_type') is not None))
+            key.append(keys.setdefault((rule['level'], rule['metric'], rule['op'][0]), len(keys)))
+
+        self._metric = np.array(metric, dtype=np.intp)
+        self._value = np.array(value, dtype=np.float64)
+        self._sign = np.array(sign, dtype=np.float64)
+        self._inclusive = np.array(inclusive, dtype=bool)
+        self._severity = np.array(severity, dtype=np.int8)
+        self._village = np.array(village, dtype=np.intp)
+        self._type = np.array(sensor_type, dtype=np.intp)
+        self._specificity = np.array(specificity, dtype=np.int8)
+        # _shadows[a, b]: rule a overrides rule b wherever both match
+        key = np.array(key, dtype=np.intp)
+        self._shadows = ((key[:, None] == key) & (self._specificity[:, None] > self._specificity)).astype(np.float32)
+        self._scoped = bool((self._specificity > 0).any())
+
+    @staticmethod
+    def _validate(rule):
+        if not isinstance(rule, dict):
+            raise ValueError(f"Alert rule must be an object: {rule!r}")
+        if rule.get('level') not in LEVELS[1:]:
+            raise ValueError(f"Alert rule level must be one of {LEVELS[1:]}: {rule!r}")
+        if rule.get('metric') not in METRICS:
+            raise ValueError(f"Alert rule metric must be one of {METRICS}: {rule!r}")
+        if rule.get('op') not in OPS:
+            raise ValueError(f"Alert rule op must be one of {OPS}: {rule!r}")
+        try:
+            value = float(rule['value'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Alert rule needs a numeric value: {rule!r}")
+        return dict(rule, value=value)
+
+    @staticmethod
+    def _code(vocabulary, name):
+        """-1 means the rule applies to any village/type"""
+        if name is None:
+            return -1
+        return vocabulary.setdefault(name, len(vocabulary))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def _applicable(self, n_rows, villages, types):
+        """(N, M) mask of the rules in force for each reading"""
+        if not self._scoped:
+            return np.ones((n_rows, len(self.rules)), dtype=bool)
+        village_codes = self._codes_of(self._villages, villages, n_rows)
+        type_codes = self._codes_of(self._types, types, n_rows)
+        matches = ((self._village == -1) | (village_codes[:, None] == self._village)) \
+            & ((self._type == -1) | (type_codes[:, None] == self._type))
+
+        # Within each (level, metric, direction) group keep only the most specific match
+        return matches & ~(matches.astype(np.float32) @ self._shadows > 0)
+
+    @staticmethod
+    def _codes_of(vocabulary, names, n_rows):
+        if names is None:
+            return np.full(n_rows, -2, dtype=np.intp)
+        return np.fromiter((vocabulary.get(name, -2) for name in names), dtype=np.intp, count=n_rows)
+
+    def evaluate(self, X, villages=None, types=None):
+        """Severity (index into LEVELS) of each reading, shape (N,).
+
+        X holds one row of METRICS per reading; `villages` and `types` are
+        optional per-reading sequences for scoped rules.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        if not self.rules or len(X) == 0:
+            return np.zeros(len(X), dtype=np.int8)
+        margin = (X[:, self._metric] - self._value) * self._sign
+        fired = (margin > 0) | (self._inclusive & (margin == 0))
+        fired &= self._applicable(len(X), villages, types)
+        return np.where(fired, self._severity, 0).max(axis=1)
+
+    def levels(self, X, villages=None, types=None):
+        """Level name (or None) of each reading"""
+        return [LEVELS[severity] for severity in self.evaluate(X, villages, types)]
+
+def load_rules():
+    """The rules from ALERT_RULES_PATH, or the defaults"""
+    if ALERT_RULES_PATH:
+        return RuleSet.load(ALERT_RULES_PATH)
+    return RuleSet(DEFAULT_RULES)
+
+rules = load_rules()
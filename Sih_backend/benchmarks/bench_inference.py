@@ -0,0 +1,70 @@
+"""Compare sklearn and compiled-forest inference latency.
+
+Run from Sih_backend after training the models:
+
+    python benchmarks/bench_inference.py [--model-dir .] [--rows 10000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from forest_compiler import compile_forest, check_parity
+from water_safety_model import resolve_model_dir
+
+MODELS = [
+    ('water_safety', 'water_safety_model.pkl', 'water_safety_scaler.pkl'),
+    ('disease', 'disease_model.pkl', 'disease_scaler.pkl'),
+]
+
+def random_readings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([
+        rng.uniform(5, 40, n),      # temperature
+        rng.uniform(4, 10, n),      # ph
+        rng.uniform(0, 30, n),      # turbidity
+        rng.uniform(50, 1500, n),   # tds
+    ])
+
+def time_per_call(fn, repeats):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model-dir', default='.')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+
+    X = random_readings(args.rows)
+    row = X[:1]
+    model_dir = resolve_model_dir(args.model_dir)
+
+    print(f"{'model':<14}{'sklearn 1-row':>16}{'compiled 1-row':>16}{'sklearn batch':>16}{'compiled batch':>16}")
+    for name, model_file, scaler_file in MODELS:
+        model = joblib.load(os.path.join(model_dir, model_file))
+        scaler = joblib.load(os.path.join(model_dir, scaler_file))
+        compiled = compile_forest(model, scaler)
+        check_parity(compiled, model, scaler, X)
+
+        sk_single = time_per_call(lambda: model.predict_proba(scaler.transform(row)), args.repeats)
+        cf_single = time_per_call(lambda: compiled.predict_proba(row), args.repeats)
+        sk_batch = time_per_call(lambda: model.predict_proba(scaler.transform(X)), 5)
+        cf_batch = time_per_call(lambda: compiled.predict_proba(X), 5)
+        print(
+            f"{name:<14}{sk_single * 1e3:>13.3f} ms{cf_single * 1e3:>13.3f} ms"
+            f"{sk_batch * 1e3:>13.1f} ms{cf_batch * 1e3:>13.1f} ms"
+        )
+    print(f"parity: compiled outputs match sklearn on {args.rows} random rows")
+
+if __name__ == '__main__':
+    main()
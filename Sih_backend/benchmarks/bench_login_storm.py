@@ -0,0 +1,85 @@
+"""Measure sensor ingest latency with and without a concurrent login storm.
+
+Starts the API with uvicorn on a throwaway local database (or uses --url),
+posts readings to /public/sensor_data from a few clients, and reports ingest
+p50/p99 first on its own and then while many clients log in at once:
+
+    python benchmarks/bench_login_storm.py [--seconds 10] [--logins 64]
+
+Run it against the previous commit to see the difference bcrypt offloading
+makes; with hashing in the request threadpool, ingest p99 climbs to the
+length of the login queue.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from local_server import running_server
+
+READING = {"id": "SEN-BENCH", "village": "Bench", "lat": 0.0, "lng": 0.0,
+           "temperature": 25.0, "ph": 7.0, "turbidity": 2.0, "tds": 200.0}
+
+def ingest_worker(url, stop, latencies):
+    with httpx.Client(base_url=url, timeout=30) as client:
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.post('/public/sensor_data', json=READING)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+def login_worker(url, stop, statuses):
+    with httpx.Client(base_url=url, timeout=60) as client:
+        while not stop.is_set():
+            response = client.post('/login', data={'username': 'bench', 'password': 'bench-password'})
+            statuses.append(response.status_code)
+            if response.status_code == 429:
+                # Back off like a well-behaved client
+                stop.wait(float(response.headers.get('Retry-After', 1)))
+
+def run_phase(url, seconds, ingest_clients, login_clients):
+    stop = threading.Event()
+    latencies, statuses = [], []
+    threads = [threading.Thread(target=ingest_worker, args=(url, stop, latencies)) for _ in range(ingest_clients)]
+    threads += [threading.Thread(target=login_worker, args=(url, stop, statuses)) for _ in range(login_clients)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    return np.array(latencies), statuses
+
+def report(name, latencies, statuses):
+    p50, p99 = np.percentile(latencies, [50, 99]) if len(latencies) else (float('nan'), float('nan'))
+    logins = f"{statuses.count(200)} ok / {statuses.count(429)} rejected" if statuses else "-"
+    print(f"{name:<14}{len(latencies):>10}{p50:>10.1f}{p99:>10.1f}{latencies.max() if len(latencies) else float('nan'):>10.1f}   {logins}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='benchmark a running API instead of starting one')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--ingest-clients', type=int, default=4)
+    parser.add_argument('--logins', type=int, default=64, help='concurrent login clients during the storm')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        server = nullcontext(args.url) if args.url else \
+            running_server({'TURSO_DATABASE_URL': os.path.join(tmpdir, 'bench.db')})
+        with server as url:
+            httpx.post(url + '/signup', json={'username': 'bench', 'password': 'bench-password'}, timeout=30)
+            baseline = run_phase(url, args.seconds, args.ingest_clients, 0)
+            storm = run_phase(url, args.seconds, args.ingest_clients, args.logins)
+
+    print(f"{'phase':<14}{'requests':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}   logins")
+    report('ingest only', *baseline)
+    report('login storm', *storm)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Measure the hot read queries with and without the secondary indexes.
+
+Seeds a local libsql file with synthetic history, alerts and reports, times
+each query, creates the indexes from main.py and times them again:
+
+    python benchmarks/bench_queries.py [--rows 1000000] [--db bench_queries.db]
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+import libsql
+import numpy as np
+
+# Keep in sync with INDEXES in main.py (importing main would connect to Turso)
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_sensor_history_sensor_created ON sensor_history (sensor_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_alerts_sensor_timestamp ON alerts (sensor_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_alerts_timestamp_id ON alerts (timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS idx_health_reports_village_created_id ON health_reports (village, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_health_reports_created_id ON health_reports (created_at, id)",
+]
+
+SCHEMA = [
+    """CREATE TABLE sensor_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, sensor_id TEXT, village TEXT,
+        temperature REAL, ph REAL, turbidity REAL, tds REAL, created_at TEXT)""",
+    """CREATE TABLE alerts (
+        id TEXT PRIMARY KEY, sensor_id TEXT, message TEXT, level TEXT,
+        timestamp TEXT, acknowledged INTEGER DEFAULT 0)""",
+    """CREATE TABLE health_reports (
+        id TEXT PRIMARY KEY, village TEXT, symptoms TEXT, created_at TEXT, phone TEXT)""",
+]
+
+N_SENSORS = 200
+N_VILLAGES = 20
+SEED_CHUNK = 50000
+
+def timestamps(rng, n, now, days=90):
+    offsets = rng.integers(0, days * 86400, n)
+    return [(now - timedelta(seconds=int(s))).isoformat() for s in offsets]
+
+def seed(conn, n_history, n_alerts, n_reports):
+    rng = np.random.default_rng(0)
+    now = datetime.utcnow()
+    for statement in SCHEMA:
+        conn.execute(statement)
+
+    for start in range(0, n_history, SEED_CHUNK):
+        n = min(SEED_CHUNK, n_history - start)
+        sensors = rng.integers(0, N_SENSORS, n)
+        values = rng.uniform(0, 100, (n, 4))
+        conn.executemany(
+            "INSERT INTO sensor_history (sensor_id, village, temperature, ph, turbidity, tds, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(f"SEN-{s:03d}", f"Village {s % N_VILLAGES}", *map(float, v), ts)
+             for s, v, ts in zip(sensors, values, timestamps(rng, n, now))])
+
+    sensors = rng.integers(0, N_SENSORS, n_alerts)
+    conn.executemany(
+        "INSERT INTO alerts (id, sensor_id, message, level, timestamp) VALUES (?, ?, ?, ?, ?)",
+        [(f"ALT-{i}", f"SEN-{s:03d}", "benchmark", "warning", ts)
+         for i, (s, ts) in enumerate(zip(sensors, timestamps(rng, n_alerts, now)))])
+
+    villages = rng.integers(0, N_VILLAGES, n_reports)
+    conn.executemany(
+        "INSERT INTO health_reports (id, village, symptoms, created_at, phone) VALUES (?, ?, ?, ?, ?)",
+        [(f"REP-{i}", f"Village {v}", "fever", ts, None)
+         for i, (v, ts) in enumerate(zip(villages, timestamps(rng, n_reports, now)))])
+    conn.commit()
+
+def queries():
+    now = datetime.utcnow()
+    week_ago = (now - timedelta(days=7)).isoformat()
+    return [
+        ("history latest 20",
+         "SELECT temperature, ph, turbidity, tds, created_at FROM sensor_history WHERE sensor_id=? ORDER BY created_at DESC LIMIT 20",
+         ("SEN-042",)),
+        ("alert throttle",
+         "SELECT timestamp FROM alerts WHERE sensor_id = ? AND timestamp > ? ORDER BY timestamp DESC LIMIT 1",
+         ("SEN-042", (now - timedelta(minutes=1)).isoformat())),
+        ("alerts newest 100",
+         "SELECT id, sensor_id, message, level, timestamp, acknowledged FROM alerts ORDER BY timestamp DESC, id DESC LIMIT 100",
+         ()),
+        ("alerts keyset page",
+         "SELECT id, sensor_id, message, level, timestamp, acknowledged FROM alerts WHERE (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT 100",
+         ((now - timedelta(days=30)).isoformat(), "ALT-0")),
+        ("reports village week",
+         "SELECT id, village, symptoms, created_at, phone FROM health_reports WHERE village=? AND created_at >= ? ORDER BY created_at DESC, id DESC",
+         ("Village 7", week_ago)),
+    ]
+
+def time_query(conn, sql, params, repeats):
+    conn.execute(sql, params).fetchall()  # warm the page cache
+    start = time.perf_counter()
+    for _ in range(repeats):
+        conn.execute(sql, params).fetchall()
+    return (time.perf_counter() - start) / repeats * 1000
+
+def query_plan(conn, sql, params):
+    return "; ".join(r[-1] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall())
+
+def run(conn, repeats):
+    results = {}
+    for name, sql, params in queries():
+        results[name] = (time_query(conn, sql, params, repeats), query_plan(conn, sql, params))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default='bench_queries.db')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='sensor_history rows')
+    parser.add_argument('--alerts', type=int, default=100_000)
+    parser.add_argument('--reports', type=int, default=100_000)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    conn = libsql.connect(args.db)
+    start = time.perf_counter()
+    seed(conn, args.rows, args.alerts, args.reports)
+    print(f"Seeded {args.rows} history rows, {args.alerts} alerts, {args.reports} reports in {time.perf_counter() - start:.1f}s")
+
+    before = run(conn, args.repeats)
+    start = time.perf_counter()
+    for statement in INDEXES:
+        conn.execute(statement)
+    conn.execute("ANALYZE")
+    conn.commit()
+    print(f"Built indexes in {time.perf_counter() - start:.1f}s\n")
+    after = run(conn, args.repeats)
+
+    print(f"{'query':<22}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name in before:
+        b, a = before[name][0], after[name][0]
+        print(f"{name:<22}{b:>12.3f}{a:>12.3f}{b / a:>9.0f}x")
+    print("\nQuery plans after indexing:")
+    for name, (_, plan) in after.items():
+        print(f"  {name}: {plan}")
+
+    conn.close()
+    os.remove(args.db)
+
+if __name__ == '__main__':
+    main()
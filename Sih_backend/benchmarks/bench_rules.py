@@ -0,0 +1,64 @@
+"""Compare the old scalar threshold checks with the vectorized alert rules.
+
+Scores synthetic readings both ways, checks they agree and reports rows per
+second, with the default rules and with village-scoped overrides added:
+
+    python benchmarks/bench_rules.py [--rows 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from alert_rules import DEFAULT_RULES, RuleSet
+
+def scalar_level(temperature, ph, turbidity, tds):
+    """The if-chain evaluate_alert used before the rule engine"""
+    if ph < 6.5 or ph > 8.5 or turbidity > 10 or tds > 500:
+        return "danger"
+    if 5 < turbidity <= 10 or 300 < tds <= 500:
+        return "warning"
+    return None
+
+def readings(n, seed=0):
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([
+        rng.normal(25, 5, n), rng.normal(7.0, 0.8, n), rng.exponential(4, n), rng.normal(320, 120, n)
+    ])
+    villages = [f"Village {v}" for v in rng.integers(0, 50, n)]
+    return X, villages
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    X, villages = readings(args.rows)
+    rows = X.tolist()
+    default = RuleSet(DEFAULT_RULES)
+    scoped = RuleSet(DEFAULT_RULES + [
+        {"level": "danger", "metric": "turbidity", "op": ">", "value": 15, "village": f"Village {v}"}
+        for v in range(10)
+    ])
+
+    expected, scalar_s = timed(lambda: [scalar_level(*row) for row in rows])
+    actual, default_s = timed(lambda: default.levels(X))
+    if actual != expected:
+        raise SystemExit("Vectorized rules disagree with the scalar checks")
+    _, scoped_s = timed(lambda: scoped.evaluate(X, villages=villages))
+
+    print(f"{'evaluator':<26}{'seconds':>10}{'rows/s':>14}")
+    for name, seconds in [('scalar if-chain', scalar_s), ('RuleSet.levels', default_s),
+                          ('RuleSet.evaluate, scoped', scoped_s)]:
+        print(f"{name:<26}{seconds:>10.3f}{args.rows / seconds:>14,.0f}")
+
+if __name__ == '__main__':
+    main()
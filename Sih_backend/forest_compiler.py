@@ -0,0 +1,130 @@
+import numpy as np
+
+class CompiledForest:
+    """A fitted StandardScaler + RandomForestClassifier flattened into NumPy arrays.
+
+    Every tree is stored back to back in the same node arrays and leaves point
+    at themselves. Prediction only touches NumPy, none of sklearn's input
+    validation, per-estimator dispatch or joblib threading, which is what
+    dominates sklearn's cost on one or a few rows.
+    """
+
+    FIELDS = ('mean', 'scale', 'feature', 'threshold', 'left', 'right', 'value', 'roots', 'classes')
+
+    def __init__(self, mean, scale, feature, threshold, left, right, value, roots, classes):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.feature = np.asarray(feature, dtype=np.intp)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.intp)
+        self.right = np.asarray(right, dtype=np.intp)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.intp)
+        self.classes = np.asarray(classes)
+        # Interleaved [left, right] per node so one take() picks the next node
+        self._children = np.stack([self.left, self.right], axis=1).ravel()
+        self._is_leaf = self.left == np.arange(len(self.left))
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def save(self, path):
+        """Write the node arrays to a .npz file"""
+        with open(path, 'wb') as f:
+            np.savez(f, **{name: getattr(self, name) for name in self.FIELDS})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(**{name: data[name] for name in cls.FIELDS})
+
+    def _leaves(self, X):
+        """Return the leaf reached by every row in every tree, shape (N, n_trees)"""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        # sklearn scales in float64 and then compares float32 features against
+        # float64 thresholds; do the same so the splits agree exactly
+        X_scaled = ((X - self.mean) / self.scale).astype(np.float32).astype(np.float64)
+        n_rows, n_features = X_scaled.shape
+
+        # Walk every (row, tree) pair at once as flat 1-D arrays, dropping
+        # pairs from the working set as soon as they land on a leaf
+        X_flat = X_scaled.ravel()
+        row_offsets = np.repeat(np.arange(n_rows) * n_features, self.n_trees)
+        nodes = np.tile(self.roots, n_rows)
+        positions = np.arange(len(nodes))
+        leaves = nodes.copy()
+        while len(nodes):
+            go_right = X_flat.take(row_offsets + self.feature.take(nodes)) > self.threshold.take(nodes)
+            nodes = self._children.take(2 * nodes + go_right)
+            done = self._is_leaf.take(nodes)
+            if done.any():
+                leaves[positions[done]] = nodes[done]
+                active = ~done
+                nodes = nodes[active]
+                row_offsets = row_offsets[active]
+                positions = positions[active]
+        return leaves.reshape(n_rows, self.n_trees)
+
+    def predict_proba(self, X):
+        """Class probabilities averaged over the trees, shape (N, n_classes)"""
+        return self.value[self._leaves(X)].mean(axis=1)
+
+    def predict(self, X):
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1))
+
+def compile_forest(model, scaler):
+    """Flatten a fitted RandomForestClassifier and its StandardScaler"""
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(n_nodes)
+        is_leaf = tree.children_left == -1
+
+        # Leaves loop back onto themselves so extra traversal steps are no-ops
+        left = np.where(is_leaf, node_ids, tree.children_left) + offset
+        right = np.where(is_leaf, node_ids, tree.children_right) + offset
+        feature = np.where(is_leaf, 0, tree.feature)
+
+        # Store per-leaf class distributions normalized like DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :].astype(np.float64)
+        totals = value.sum(axis=1, keepdims=True)
+        totals[totals == 0.0] = 1.0
+
+        features.append(feature)
+        thresholds.append(tree.threshold)
+        lefts.append(left)
+        rights.append(right)
+        values.append(value / totals)
+        roots.append(offset)
+        offset += n_nodes
+
+    return CompiledForest(
+        mean=scaler.mean_,
+        scale=scaler.scale_,
+        feature=np.concatenate(features),
+        threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts),
+        right=np.concatenate(rights),
+        value=np.concatenate(values),
+        roots=np.array(roots),
+        classes=model.classes_,
+    )
+
+def check_parity(compiled, model, scaler, X, atol=1e-9):
+    """Raise if the compiled forest disagrees with sklearn on X"""
+    expected = model.predict_proba(scaler.transform(X))
+    actual = compiled.predict_proba(X)
+    if expected.shape != actual.shape or not np.allclose(expected, actual, rtol=0, atol=atol):
+        worst = float(np.max(np.abs(expected - actual))) if expected.shape == actual.shape else float('nan')
+        raise ValueError(f"Compiled forest does not match sklearn (max abs diff {worst})")
+    # Ignore rows where the top two classes tie, argmax there depends on summation order
+    ordered = np.sort(expected, axis=1)
+    decided = ordered[:, -1] - ordered[:, -2] > atol if expected.shape[1] > 1 else np.ones(len(X), dtype=bool)
+    expected_classes = model.classes_.take(np.argmax(expected, axis=1))
+    if not np.array_equal(expected_classes[decided], compiled.predict(X)[decided]):
+        raise ValueError("Compiled forest predicts different classes than sklearn")
@@ -0,0 +1,47 @@
+"""Run the API under uvicorn in a subprocess, for benchmarks and tests.
+
+    with running_server({"TURSO_DATABASE_URL": path}, workers=2) as url:
+        httpx.get(url + "/docs")
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+@contextmanager
+def running_server(env=None, workers=1, startup_timeout=60.0):
+    """Start `uvicorn main:app` with extra environment variables and yield its
+    base URL once it answers; the server is stopped when the block exits"""
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--workers', str(workers),
+         '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env=dict(os.environ, **(env or {})))
+    url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            if proc.poll() is not None:
+                raise RuntimeError(f'API exited during startup with code {proc.returncode}')
+            try:
+                httpx.get(url + '/docs', timeout=1)
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError('API did not start')
+                time.sleep(0.1)
+        yield url
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
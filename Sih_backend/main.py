@@ -1,18 +1,34 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Body, Query, Request, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel
-from typing import List, Optional, Literal
+from pydantic import BaseModel, ValidationError
+from typing import Any, List, Optional, Literal
 from fastapi.middleware.cors import CORSMiddleware
-from datetime import datetime, timedelta
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from uuid import uuid4
 import sqlite3 
 from fastapi import WebSocket, WebSocketDisconnect
 import os
-import random
-import joblib
+import asyncio
+import base64
+import json
+import zlib
+import numpy as np
 import uvicorn
+import queue
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from alert_rules import LEVELS as ALERT_LEVELS, rules as alert_rules
 # -------------------- CONFIG --------------------
 SECRET_KEY = os.environ.get("SECRET_KEY", "supersecretkey") # change this in production
 ALGORITHM = "HS256"
@@ -39,30 +55,498 @@ if __name__ == "__main__":
     )
 
 # -------------------- WEBSOCKET MANAGER --------------------
+# Messages a client may fall behind before it counts as a slow consumer, what
+# happens then ("resync": discard its backlog and send a resync marker so it
+# refetches state; "drop": close it), and how long one send may take
+WS_SEND_QUEUE_SIZE = int(os.environ.get("WS_SEND_QUEUE_SIZE", "256"))
+WS_SLOW_CLIENT_POLICY = os.environ.get("WS_SLOW_CLIENT_POLICY", "resync")
+WS_SEND_TIMEOUT = float(os.environ.get("WS_SEND_TIMEOUT", "10"))
+# With a tick > 0 (ms), sensor_update events are held for one tick and only the
+# latest reading per sensor goes out, batched into one sensor_batch frame
+WS_COALESCE_MS = float(os.environ.get("WS_COALESCE_MS", "0"))
+
+RESYNC_MESSAGE = json.dumps({"type": "resync"})
+EVENT_TYPES = ("sensor_update", "alert", "health_report")
+
+# Subscription topics: every event, one village, or one sensor
+ALL_TOPIC = ("all",)
+
+class ClientConnection:
+    """One websocket with its own outbound queue, drained by its own writer task.
+
+    `topics` say which villages/sensors the client follows and `types` which
+    event types it wants (None for all of them).
+    """
+
+    def __init__(self, ws: WebSocket, max_lag: int, user: Optional[dict] = None):
+        self.ws = ws
+        self.user = user
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_lag)
+        self.writer: Optional[asyncio.Task] = None
+        self.topics: set = set()
+        self.types: Optional[set] = None
+        # Sent when the writer stops: 1000 normally, 1001 on shutdown, 1013 when evicted
+        self.close_code = 1000
+
 class ConnectionManager:
-    def __init__(self):
-        self.active: list[WebSocket] = []
+    def __init__(self, max_lag=WS_SEND_QUEUE_SIZE, slow_client_policy=WS_SLOW_CLIENT_POLICY, send_timeout=WS_SEND_TIMEOUT,
+                 coalesce_ms=WS_COALESCE_MS):
+        self.active: dict[WebSocket, ClientConnection] = {}
+        # topic -> clients subscribed to it, so an event only visits its audience
+        self._index: dict[tuple, set] = {}
+        self._max_lag = max_lag
+        self._slow_client_policy = slow_client_policy
+        self._send_timeout = send_timeout
+        self._tick = coalesce_ms / 1000
+        # Latest sensor_update per sensor waiting for the next tick
+        self._pending: dict[str, dict] = {}
+        self._ticker: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.resyncs = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self.batches = 0
+
+    async def start(self):
+        if self._tick > 0:
+            self._ticker = asyncio.create_task(self._run_ticks())
 
-    async def connect(self, ws: WebSocket):
+    async def stop(self):
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+        writers = [c.writer for c in self.active.values() if c.writer is not None]
+        for ws in list(self.active):
+            self.disconnect(ws, code=1001)
+        await asyncio.gather(*writers, return_exceptions=True)
+
+    async def _run_ticks(self):
+        while True:
+            await asyncio.sleep(self._tick)
+            if self._pending:
+                self._flush_pending()
+                await asyncio.sleep(0)
+
+    def _flush_pending(self):
+        """Send every client one sensor_batch frame with the sensors it follows"""
+        pending, self._pending = self._pending, {}
+        per_client = {}
+        for message in pending.values():
+            for client in self._recipients(message):
+                per_client.setdefault(client, []).append(message["sensor"])
+        # Clients following the same sensors share one serialized frame
+        frames = {}
+        for client, sensors in per_client.items():
+            key = tuple(s.get("id") for s in sensors)
+            data = frames.get(key)
+            if data is None:
+                data = frames[key] = json.dumps({"type": "sensor_batch", "sensors": sensors})
+            self._enqueue(client, data)
+        self.batches += 1
+
+    async def connect(self, ws: WebSocket, user: Optional[dict] = None, topics=(ALL_TOPIC,)):
         await ws.accept()
-        self.active.append(ws)
+        client = ClientConnection(ws, self._max_lag, user)
+        client.writer = asyncio.create_task(self._write(client))
+        # Let the writer reach its try block, so even an immediate disconnect closes the socket
+        await asyncio.sleep(0)
+        self.active[ws] = client
+        self.subscribe(client, topics)
+        return client
 
-    def disconnect(self, ws: WebSocket):
-        if ws in self.active:
-            self.active.remove(ws)
+    def _forget(self, client: ClientConnection):
+        self.active.pop(client.ws, None)
+        self.subscribe(client, ())
+
+    def disconnect(self, ws: WebSocket, code: int = 1000):
+        client = self.active.get(ws)
+        if client is not None:
+            client.close_code = code
+            self._forget(client)
+            if client.writer is not None:
+                client.writer.cancel()
+
+    def subscribe(self, client: ClientConnection, topics, types=None):
+        """Replace the client's topics and event-type filter"""
+        for topic in client.topics:
+            subscribers = self._index.get(topic)
+            if subscribers is not None:
+                subscribers.discard(client)
+                if not subscribers:
+                    del self._index[topic]
+        client.topics = set(topics)
+        client.types = set(types) if types is not None else None
+        for topic in client.topics:
+            self._index.setdefault(topic, set()).add(client)
+
+    def send(self, client: ClientConnection, message: dict):
+        """Queue a message for a single client"""
+        try:
+            client.queue.put_nowait(json.dumps(message))
+        except asyncio.QueueFull:
+            self._fell_behind(client)
+
+    async def _write(self, client: ClientConnection):
+        try:
+            while True:
+                data = await client.queue.get()
+                await asyncio.wait_for(client.ws.send_text(data), self._send_timeout)
+                self.sent += 1
+        except asyncio.CancelledError:
+            # disconnect() set the close code: normal teardown, shutdown or eviction
+            await self._close(client, client.close_code)
+            raise
+        except Exception:
+            # Closed socket or a send that took longer than the timeout
+            self.evictions += 1
+            await self._close(client, 1013)
+        finally:
+            self._forget(client)
+
+    @staticmethod
+    async def _close(client: ClientConnection, code: int):
+        try:
+            await client.ws.close(code=code)
+        except Exception:
+            pass
+
+    def _fell_behind(self, client: ClientConnection):
+        if self._slow_client_policy == "drop":
+            if self.active.get(client.ws) is client:
+                self.evictions += 1
+                self.disconnect(client.ws, code=1013)
+            return
+        # Nothing queued is worth sending any more; the marker tells the client to refetch
+        while not client.queue.empty():
+            client.queue.get_nowait()
+        client.queue.put_nowait(RESYNC_MESSAGE)
+        self.resyncs += 1
+
+    @staticmethod
+    def _topics_of(message: dict):
+        """Topics an event is published under"""
+        event_type = message.get("type")
+        if event_type == "sensor_update":
+            sensor = message["sensor"]
+            return [ALL_TOPIC, ("village", sensor.get("village")), ("sensor", sensor.get("id"))]
+        if event_type == "alert":
+            sensor_id = message["alert"].get("sensorId")
+            # Publishers attach the reading's village; the snapshot lookup is only a fallback
+            village = message.get("village") or sensor_state.village_of(sensor_id, load=False)
+            return [ALL_TOPIC, ("village", village), ("sensor", sensor_id)]
+        if event_type == "health_report":
+            return [ALL_TOPIC, ("village", message["report"].get("village"))]
+        return [ALL_TOPIC]
+
+    def _recipients(self, message: dict):
+        event_type = message.get("type")
+        recipients = set()
+        for topic in self._topics_of(message):
+            recipients.update(self._index.get(topic, ()))
+        return [c for c in recipients if c.types is None or event_type in c.types]
+
+    def _enqueue(self, client: ClientConnection, data: str):
+        try:
+            client.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self._fell_behind(client)
 
     async def broadcast(self, message: dict):
-        stale = []
-        for ws in self.active:
-            try:
-                await ws.send_json(message)
-            except Exception:
-                stale.append(ws)
-        for s in stale:
-            self.disconnect(s)
+        """Queue a message for every subscribed client without waiting on any of them"""
+        if self._tick > 0 and message.get("type") == "sensor_update":
+            # Coalesced: keep the latest reading, the ticker sends it. Alerts
+            # and reports never wait for a tick
+            sensor_id = message["sensor"].get("id")
+            if sensor_id in self._pending:
+                self.coalesced += 1
+            self._pending[sensor_id] = message
+            return
+        recipients = self._recipients(message)
+        if not recipients:
+            return
+        # Serialize once and share the same string between all recipients
+        data = json.dumps(message)
+        for client in recipients:
+            self._enqueue(client, data)
+        # Let the writers run so a burst of events does not outrun clients that keep up
+        await asyncio.sleep(0)
+
+    def stats(self):
+        return {
+            "clients": len(self.active),
+            "topics": len(self._index),
+            "max_lag": self._max_lag,
+            "slow_client_policy": self._slow_client_policy,
+            "sent": self.sent,
+            "resyncs": self.resyncs,
+            "evictions": self.evictions,
+            "coalesce_ms": self._tick * 1000,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "queued": sum(c.queue.qsize() for c in list(self.active.values()))
+        }
 
 manager = ConnectionManager()
 
+# Events waiting for the dispatcher; beyond this, new events are dropped
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", "10000"))
+
+# Cross-worker fan-out. With BACKPLANE=sqlite every worker on this machine
+# shares its events through a small SQLite file, so websocket clients see
+# readings whichever worker received them; empty keeps events in-process
+BACKPLANE = os.environ.get("BACKPLANE", "")
+BACKPLANE_PATH = os.environ.get("BACKPLANE_PATH", os.path.join(tempfile.gettempdir(), "sih_events.db"))
+BACKPLANE_POLL_MS = float(os.environ.get("BACKPLANE_POLL_MS", "50"))
+BACKPLANE_RETENTION = float(os.environ.get("BACKPLANE_RETENTION", "60"))
+
+class Backplane:
+    """Shares events between worker processes.
+
+    publish() hands over an event raised in this worker; after start(), the
+    backplane calls `deliver` (from any thread) with events raised in the
+    other workers. This base class is the single-process no-op.
+    """
+
+    def start(self, deliver):
+        pass
+
+    def stop(self):
+        pass
+
+    def publish(self, event: dict):
+        pass
+
+    def stats(self):
+        return {"kind": "local"}
+
+class SqliteBackplane(Backplane):
+    """Backplane over an append-only SQLite table that every worker polls.
+
+    One thread per worker writes its outgoing events in batches and reads rows
+    other workers appended since its last poll. Rows older than `retention`
+    seconds are pruned.
+    """
+
+    def __init__(self, path, poll_interval, retention, max_pending=EVENT_QUEUE_SIZE):
+        self._path = path
+        self._poll_interval = poll_interval
+        self._retention = retention
+        self._origin = uuid4().hex
+        self._outbox = queue.Queue(maxsize=max_pending)
+        self._stop = threading.Event()
+        self._thread = None
+        self._deliver = None
+        self._last_id = 0
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self._path, timeout=5, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        return conn
+
+    def start(self, deliver):
+        self._deliver = deliver
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    origin TEXT,
+                    payload TEXT,
+                    created REAL
+                )
+            """)
+            conn.commit()
+            # Only events published from now on
+            self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="backplane", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+
+    def publish(self, event: dict):
+        try:
+            self._outbox.put_nowait(json.dumps(event))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _exchange(self, conn):
+        outgoing = []
+        try:
+            outgoing.append(self._outbox.get(timeout=self._poll_interval))
+            while True:
+                outgoing.append(self._outbox.get_nowait())
+        except queue.Empty:
+            pass
+        if outgoing:
+            now = time.time()
+            with conn:
+                conn.executemany(
+                    "INSERT INTO events (origin, payload, created) VALUES (?, ?, ?)",
+                    [(self._origin, payload, now) for payload in outgoing]
+                )
+        rows = conn.execute(
+            "SELECT id, origin, payload FROM events WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        received = 0
+        for row_id, origin, payload in rows:
+            self._last_id = row_id
+            if origin != self._origin:
+                self._deliver(json.loads(payload))
+                received += 1
+        with self._lock:
+            self.sent += len(outgoing)
+            self.received += received
+
+    def _run(self):
+        conn = self._connect()
+        last_prune = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                self._exchange(conn)
+                if time.monotonic() - last_prune > self._retention:
+                    with conn:
+                        conn.execute("DELETE FROM events WHERE created < ?", (time.time() - self._retention,))
+                    last_prune = time.monotonic()
+            except sqlite3.Error as exc:
+                with self._lock:
+                    self.errors += 1
+                print(f"Backplane exchange failed: {exc}")
+                self._stop.wait(1.0)
+        conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "kind": "sqlite",
+                "path": self._path,
+                "pending": self._outbox.qsize(),
+                "sent": self.sent,
+                "received": self.received,
+                "dropped": self.dropped,
+                "errors": self.errors
+            }
+
+def make_backplane() -> Backplane:
+    if BACKPLANE == "sqlite":
+        return SqliteBackplane(BACKPLANE_PATH, BACKPLANE_POLL_MS / 1000, BACKPLANE_RETENTION)
+    if BACKPLANE:
+        raise ValueError(f"Unknown BACKPLANE: {BACKPLANE}")
+    return Backplane()
+
+class EventBus:
+    """Thread-safe hand-off from request handlers to websocket clients.
+
+    Sync routes run in worker threads with no event loop, so they cannot
+    schedule broadcasts themselves. publish() works from any thread: it hands
+    the event to the loop with call_soon_threadsafe, and a single dispatcher
+    task on the loop drains the bounded queue into ConnectionManager. Events
+    also go out over the backplane, and events from other workers come back
+    in through the same queue.
+    """
+
+    def __init__(self, manager, max_size, backplane: Backplane):
+        self._manager = manager
+        self._max_size = max_size
+        self._backplane = backplane
+        self._loop = None
+        self._queue = None
+        self._task = None
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.failed = 0
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self._max_size)
+        self._task = self._loop.create_task(self._dispatch())
+        # Connecting and creating the table block, keep them off the event loop
+        await asyncio.to_thread(self._backplane.start, self._submit)
+
+    async def stop(self):
+        await asyncio.to_thread(self._backplane.stop)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._loop = None
+
+    def publish(self, event: dict):
+        """Queue an event for every websocket client; never blocks or raises"""
+        with self._lock:
+            self.published += 1
+        self._backplane.publish(event)
+        self._submit(event)
+
+    def _submit(self, event: dict):
+        loop = self._loop
+        if loop is None:
+            self._count_drop()
+            return
+        try:
+            loop.call_soon_threadsafe(self._enqueue, event)
+        except RuntimeError:
+            # Loop already closed during shutdown
+            self._count_drop()
+
+    def _enqueue(self, event: dict):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._count_drop()
+
+    def _count_drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    async def _dispatch(self):
+        while True:
+            event = await self._queue.get()
+            try:
+                await self._manager.broadcast(event)
+                with self._lock:
+                    self.delivered += 1
+            except Exception as exc:
+                with self._lock:
+                    self.failed += 1
+                print(f"Broadcast of {event.get('type')} event failed: {exc}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "depth": self._queue.qsize() if self._queue is not None else 0,
+                "capacity": self._max_size,
+                "published": self.published,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "clients": len(self._manager.active),
+                "backplane": self._backplane.stats()
+            }
+
+event_bus = EventBus(manager, EVENT_QUEUE_SIZE, make_backplane())
+
+@app.on_event("startup")
+async def start_event_bus():
+    await manager.start()
+    await event_bus.start()
+
+@app.on_event("shutdown")
+async def stop_event_bus():
+    await event_bus.stop()
+    await manager.stop()
+
 import libsql
 # -------------------- DATABASE --------------------
 # The following variables are placeholders. Please replace them with your Turso database URL and auth token.
@@ -72,14 +556,250 @@ import libsql
 TURSO_DATABASE_URL = os.environ.get("TURSO_DATABASE_URL", "YOUR_TURSO_DATABASE_URL")
 TURSO_AUTH_TOKEN = os.environ.get("TURSO_AUTH_TOKEN", "YOUR_TURSO_AUTH_TOKEN")
 
+# Connection pool limits; idle connections are pinged before reuse and closed
+# once they have been idle for too long
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+DB_IDLE_TIMEOUT = float(os.environ.get("DB_IDLE_TIMEOUT", "300"))
+DB_HEALTH_CHECK_AFTER = float(os.environ.get("DB_HEALTH_CHECK_AFTER", "30"))
+
 def get_db_connection():
-    """Get a new database connection for each request"""
+    """Open a new database connection (the pool calls this when it needs one)"""
     conn = libsql.connect(
         database=TURSO_DATABASE_URL,
         auth_token=TURSO_AUTH_TOKEN
     )
     return conn
 
+class ConnectionPool:
+    """Bounded pool of reusable database connections"""
+
+    def __init__(self, connect, max_size, acquire_timeout, idle_timeout, health_check_after):
+        self._connect = connect
+        self._acquire_timeout = acquire_timeout
+        self._idle_timeout = idle_timeout
+        self._health_check_after = health_check_after
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = deque()  # (connection, last used) with the most recent on the right
+        self._lock = threading.Lock()
+        self.max_size = max_size
+        self.opened = 0
+        self.discarded = 0
+
+    def _close(self, conn):
+        self.discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def ping(self, conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except Exception:
+            return False
+
+    def _prune_idle(self):
+        """Close connections that have sat unused past the idle timeout"""
+        cutoff = time.monotonic() - self._idle_timeout
+        expired = []
+        with self._lock:
+            while self._idle and self._idle[0][1] < cutoff:
+                expired.append(self._idle.popleft()[0])
+        for conn in expired:
+            self._close(conn)
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self._acquire_timeout):
+            raise HTTPException(status_code=503, detail="Database busy, try again")
+        try:
+            self._prune_idle()
+            while True:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    conn = self._connect()
+                    self.opened += 1
+                    return conn
+                conn, last_used = item
+                if time.monotonic() - last_used > self._health_check_after and not self.ping(conn):
+                    self._close(conn)
+                    continue
+                return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        try:
+            if not discard and conn.in_transaction:
+                # Never hand the next caller someone else's uncommitted writes
+                conn.rollback()
+        except Exception:
+            discard = True
+        if discard:
+            self._close(conn)
+        else:
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn, discard=not self.ping(conn))
+            raise
+        else:
+            self.release(conn)
+
+    def stats(self):
+        with self._lock:
+            idle = len(self._idle)
+        return {"max_size": self.max_size, "idle": idle, "opened": self.opened, "discarded": self.discarded}
+
+db_pool = ConnectionPool(get_db_connection, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_IDLE_TIMEOUT, DB_HEALTH_CHECK_AFTER)
+
+class _RequestConnection:
+    """Holds the one pooled connection a request uses, checked out on first use"""
+
+    def __init__(self):
+        self.conn = None
+
+    def get(self):
+        if self.conn is None:
+            self.conn = db_pool.acquire()
+        return self.conn
+
+    def release(self, failed=False):
+        if self.conn is not None:
+            conn, self.conn = self.conn, None
+            db_pool.release(conn, discard=failed and not db_pool.ping(conn))
+
+_request_connection: ContextVar[Optional[_RequestConnection]] = ContextVar("request_connection", default=None)
+
+@contextmanager
+def db_connection():
+    """Database connection for the current request.
+
+    Inside a request every caller (auth, handler, helpers) shares one pooled
+    connection that goes back to the pool when the response is finished.
+    Outside a request this checks a connection out of the pool just for the
+    `with` block.
+    """
+    holder = _request_connection.get()
+    if holder is not None:
+        yield holder.get()
+        return
+    with db_pool.connection() as conn:
+        yield conn
+
+class RequestConnectionMiddleware:
+    """Gives each HTTP request its own _RequestConnection and releases it afterwards"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        holder = _RequestConnection()
+        token = _request_connection.set(holder)
+        failed = False
+        try:
+            await self.app(scope, receive, send)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _request_connection.reset(token)
+            holder.release(failed)
+
+app.add_middleware(RequestConnectionMiddleware)
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_sensor_history_sensor_created ON sensor_history (sensor_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_alerts_sensor_timestamp ON alerts (sensor_id, timestamp)",
+    # Listings page on (sort column, id), so id is part of the key
+    "CREATE INDEX IF NOT EXISTS idx_alerts_timestamp_id ON alerts (timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS idx_health_reports_village_created_id ON health_reports (village, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_health_reports_created_id ON health_reports (created_at, id)",
+]
+
+# -------------------- HISTORY ROLLUPS --------------------
+# Per-sensor min/max/sum/count of every metric per minute, hour and day, kept
+# up to date on ingest so long chart windows never touch raw history
+ROLLUP_METRICS = ("temperature", "ph", "turbidity", "tds")
+# resolution -> (table, length of the isoformat prefix kept, suffix completing the bucket start, bucket seconds)
+ROLLUPS = {
+    "minute": ("sensor_history_minute", 16, ":00", 60),
+    "hour": ("sensor_history_hour", 13, ":00:00", 3600),
+    "day": ("sensor_history_day", 10, "T00:00:00", 86400),
+}
+_ROLLUP_COLUMNS = ", ".join(f"{m}_min, {m}_max, {m}_sum" for m in ROLLUP_METRICS)
+
+def rollup_bucket(timestamp: str, resolution: str) -> str:
+    """Start of the bucket an isoformat timestamp falls into"""
+    _, prefix, suffix, _ = ROLLUPS[resolution]
+    return timestamp[:prefix] + suffix
+
+def create_rollup_tables(conn):
+    for table, _, _, _ in ROLLUPS.values():
+        metric_columns = ", ".join(f"{m}_min REAL, {m}_max REAL, {m}_sum REAL" for m in ROLLUP_METRICS)
+        conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            sensor_id TEXT,
+            bucket TEXT,
+            samples INTEGER,
+            {metric_columns},
+            PRIMARY KEY (sensor_id, bucket)
+        )
+        """)
+
+def update_rollups(conn, readings: List[tuple]):
+    """Fold (SensorReading, timestamp) pairs into every rollup table (caller commits)"""
+    updates = ", ".join(
+        ["samples = samples + excluded.samples"] +
+        [f"{m}_min = MIN({m}_min, excluded.{m}_min), {m}_max = MAX({m}_max, excluded.{m}_max), {m}_sum = {m}_sum + excluded.{m}_sum" for m in ROLLUP_METRICS]
+    )
+    placeholders = ", ".join(["?"] * (3 + 3 * len(ROLLUP_METRICS)))
+    for resolution, (table, _, _, _) in ROLLUPS.items():
+        # Pre-aggregate the batch so each bucket costs one upsert
+        buckets = {}
+        for r, ts in readings:
+            key = (r.id, rollup_bucket(ts, resolution))
+            values = [getattr(r, m) for m in ROLLUP_METRICS]
+            agg = buckets.get(key)
+            if agg is None:
+                buckets[key] = [1] + [v for value in values for v in (value, value, value)]
+                continue
+            agg[0] += 1
+            for i, value in enumerate(values):
+                agg[1 + 3 * i] = min(agg[1 + 3 * i], value)
+                agg[2 + 3 * i] = max(agg[2 + 3 * i], value)
+                agg[3 + 3 * i] += value
+        conn.executemany(f"""
+            INSERT INTO {table} (sensor_id, bucket, samples, {_ROLLUP_COLUMNS})
+            VALUES ({placeholders})
+            ON CONFLICT (sensor_id, bucket) DO UPDATE SET {updates}
+        """, [(sensor_id, bucket, *agg) for (sensor_id, bucket), agg in buckets.items()])
+
+def rebuild_rollups(conn):
+    """Recompute every rollup table from raw sensor_history (caller commits)"""
+    aggregates = ", ".join(f"MIN({m}), MAX({m}), SUM({m})" for m in ROLLUP_METRICS)
+    for table, prefix, suffix, _ in ROLLUPS.values():
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"""
+            INSERT INTO {table} (sensor_id, bucket, samples, {_ROLLUP_COLUMNS})
+            SELECT sensor_id, substr(created_at, 1, {prefix}) || '{suffix}', COUNT(*), {aggregates}
+            FROM sensor_history
+            GROUP BY sensor_id, substr(created_at, 1, {prefix})
+        """)
+
 # Initialize database tables
 def init_database():
     """Initialize database tables"""
@@ -167,10 +887,44 @@ def init_database():
         message TEXT,
         level TEXT,
         timestamp TEXT,
-        acknowledged INTEGER DEFAULT 0
+        acknowledged INTEGER DEFAULT 0,
+        cleared_at TEXT
     )
     """)
 
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS predictions (
+        sensor_id TEXT,
+        reading_at TEXT,
+        is_safe INTEGER,
+        safety_confidence REAL,
+        risk_level TEXT,
+        predicted_disease TEXT,
+        disease_confidence REAL,
+        model_version TEXT,
+        scored_at TEXT,
+        PRIMARY KEY (sensor_id, reading_at)
+    )
+    """)
+
+    # Ensure cleared_at column exists for older DBs
+    try:
+        conn.execute("ALTER TABLE alerts ADD COLUMN cleared_at TEXT")
+    except Exception:
+        pass
+
+    # Rollups are built from raw history once for databases that predate them
+    create_rollup_tables(conn)
+    day_table = ROLLUPS["day"][0]
+    if conn.execute(f"SELECT 1 FROM {day_table} LIMIT 1").fetchone() is None and \
+            conn.execute("SELECT 1 FROM sensor_history LIMIT 1").fetchone() is not None:
+        rebuild_rollups(conn)
+
+    # Indexes matching the hot queries (history per sensor, alerts per sensor
+    # and listing, report filters by village and date)
+    for statement in INDEXES:
+        conn.execute(statement)
+
     conn.commit()
     conn.close()
 
@@ -232,9 +986,9 @@ def seed_if_empty():
                     )
                 # seed alert for abnormal values
                 try:
-                    unsafe = s["ph"] < 6.5 or s["ph"] > 8.5 or s["turbidity"] > 10 or s["tds"] > 500
-                    warn = (5 < s["turbidity"] <= 10) or (300 < s["tds"] <= 500)
-                    level = "danger" if unsafe else ("warning" if warn else None)
+                    level = alert_rules.levels(
+                        [[s["temperature"], s["ph"], s["turbidity"], s["tds"]]], villages=[s["village"]]
+                    )[0]
                     if level:
                         conn.execute(
                             "INSERT OR REPLACE INTO alerts (id, sensor_id, message, level, timestamp, acknowledged) VALUES (?, ?, ?, ?, ?, 0)",
@@ -264,6 +1018,7 @@ def seed_if_empty():
                         "INSERT OR REPLACE INTO health_reports (id, village, symptoms, created_at) VALUES (?, ?, ?, ?)",
                         (r["id"], r["village"], ",".join(r["symptoms"]), now),
                     )
+            rebuild_rollups(conn)
             conn.commit()
         conn.close()
     except Exception:
@@ -273,13 +1028,18 @@ def seed_if_empty():
 seed_if_empty()
 
 # -------------------- MODELS --------------------
-# Load water safety and disease prediction models
-try:
-    from water_safety_model import predict_water_safety, predict_disease
-    ML_MODELS_AVAILABLE = True
-except Exception as e:
-    print(f"Error loading ML models: {e}")
-    ML_MODELS_AVAILABLE = False
+# Every prediction route goes through one pipeline that runs the safety and
+# disease models together and falls back to rule-based predictions on error
+from water_safety_model import pipeline as inference_pipeline, registry as model_registry
+
+@app.on_event("startup")
+def warm_up_models():
+    """Load the model artifacts before the first request needs them"""
+    try:
+        version = model_registry.warm_up()
+        print(f"ML models loaded (version {version})")
+    except Exception as e:
+        print(f"Error warming up ML models: {e}")
 
 # -------------------- SCHEMAS --------------------
 class Token(BaseModel):
@@ -334,6 +1094,69 @@ class PredictRequest(BaseModel):
     turbidity: float
     tds: float
 
+class PredictColumns(BaseModel):
+    sensor_id: List[str]
+    village: List[str]
+    temperature: List[float]
+    ph: List[float]
+    turbidity: List[float]
+    tds: List[float]
+
+class BatchPredictRequest(BaseModel):
+    # Either a list of rows or the same data as parallel columns
+    rows: Optional[List[PredictRequest]] = None
+    columns: Optional[PredictColumns] = None
+
+MAX_BATCH_PREDICT_ROWS = int(os.environ.get("MAX_BATCH_PREDICT_ROWS", "10000"))
+
+# Sensor history: most points one request may return, and how many buckets
+# resolution=auto aims for when choosing between the rollup tables
+HISTORY_MAX_POINTS = int(os.environ.get("HISTORY_MAX_POINTS", "5000"))
+HISTORY_AUTO_POINTS = int(os.environ.get("HISTORY_AUTO_POINTS", "60"))
+HISTORY_BUCKET_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+MAX_INGEST_BATCH = int(os.environ.get("MAX_INGEST_BATCH", "5000"))
+
+# Write-behind ingest for /public/sensor_data (off unless INGEST_WRITE_BEHIND=1)
+INGEST_WRITE_BEHIND = os.environ.get("INGEST_WRITE_BEHIND", "0") == "1"
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "10000"))
+INGEST_FLUSH_ROWS = int(os.environ.get("INGEST_FLUSH_ROWS", "500"))
+INGEST_FLUSH_MS = float(os.environ.get("INGEST_FLUSH_MS", "200"))
+INGEST_ENQUEUE_TIMEOUT = float(os.environ.get("INGEST_ENQUEUE_TIMEOUT", "0.5"))
+
+# /sensors is served from memory; the snapshot is re-read from the database at
+# most this often (seconds) to pick up writes made by other processes
+SENSOR_CACHE_REFRESH = float(os.environ.get("SENSOR_CACHE_REFRESH", "30"))
+
+# Readings are scored in the background as they arrive, so /sensors can carry
+# each sensor's latest prediction without running the models (0 turns it off)
+PREDICT_ON_INGEST = os.environ.get("PREDICT_ON_INGEST", "1") == "1"
+PREDICT_QUEUE_SIZE = int(os.environ.get("PREDICT_QUEUE_SIZE", "10000"))
+PREDICT_BATCH_ROWS = int(os.environ.get("PREDICT_BATCH_ROWS", "256"))
+PREDICT_BATCH_MS = float(os.environ.get("PREDICT_BATCH_MS", "100"))
+
+# A sensor that stays out of range raises its alert again only after
+# ALERT_COOLDOWN seconds (or straight away if it escalates), and the alert
+# clears after ALERT_CLEAR_READINGS in-range readings in a row
+ALERT_COOLDOWN = float(os.environ.get("ALERT_COOLDOWN", "60"))
+ALERT_CLEAR_READINGS = int(os.environ.get("ALERT_CLEAR_READINGS", "3"))
+# History rows scored per rules pass when replaying alert rules
+ALERT_REPLAY_CHUNK_ROWS = int(os.environ.get("ALERT_REPLAY_CHUNK_ROWS", "50000"))
+
+# Authenticated users are cached for PRINCIPAL_CACHE_TTL seconds. With
+# AUTH_TRUST_CLAIMS=1, read-only routes take role/village straight from the
+# signed token and skip the user lookup entirely
+PRINCIPAL_CACHE_SIZE = int(os.environ.get("PRINCIPAL_CACHE_SIZE", "1024"))
+PRINCIPAL_CACHE_TTL = float(os.environ.get("PRINCIPAL_CACHE_TTL", "60"))
+AUTH_TRUST_CLAIMS = os.environ.get("AUTH_TRUST_CLAIMS", "0") == "1"
+
+# bcrypt runs on its own small pool; beyond PASSWORD_HASH_MAX_PENDING hashes
+# queued or running, login/signup answer 429 instead of waiting
+# (default: half the cores, leaving the rest to request handling)
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", "32"))
+# Niceness added to the bcrypt threads; 0 keeps them at normal priority
+PASSWORD_HASH_NICE = int(os.environ.get("PASSWORD_HASH_NICE", "10"))
+
 # -------------------- AUTH HELPERS --------------------
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -341,27 +1164,177 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+class PasswordHasher:
+    """Runs bcrypt on a dedicated thread pool instead of the request threadpool.
+
+    A burst of logins then only queues behind other logins, and sensor ingest
+    keeps its threads. Each call holds an admission slot from submission until
+    the hash finishes, even if the client gave up waiting; with no slot free
+    the request is rejected with a 429. The hashing threads run at a lower
+    CPU priority (`nice`, Linux only) so they yield the cores to ingest.
+    """
+
+    def __init__(self, workers, max_pending, nice=0):
+        self._nice = nice
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt",
+                                            initializer=self._lower_priority)
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._total_ms = 0.0
+
+    def _lower_priority(self):
+        # On Linux the priority of a thread id affects only that thread
+        if self._nice and sys.platform.startswith("linux"):
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self._nice)
+            except OSError as exc:
+                print(f"Could not lower bcrypt thread priority: {exc}")
+
+    def _timed(self, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.completed += 1
+                self._total_ms += (time.perf_counter() - start) * 1000
+
+    async def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HTTPException(status_code=429, detail="Too many logins in progress, retry shortly", headers={"Retry-After": "1"})
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self._executor.submit(self._timed, fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        # Released when the hash is done, not when the caller stops waiting for it
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future=None):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    async def verify(self, plain_password, hashed_password):
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password):
+        return await self._run(get_password_hash, password)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_hash_ms": self._total_ms / self.completed if self.completed else 0.0
+            }
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING, PASSWORD_HASH_NICE)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_user(username: str):
-    conn = get_db_connection()
+def fetch_user(conn, username: str):
     row = conn.execute("SELECT username, password, role, village FROM users WHERE username=?", (username,)).fetchone()
-    conn.close()
     if row:
         return {"username": row[0], "password": row[1], "role": row[2], "village": row[3]}
     return None
 
-def authenticate_user(username: str, password: str):
-    user = get_user(username)
-    if not user or not verify_password(password, user["password"]):
+def get_user(username: str):
+    with db_connection() as conn:
+        return fetch_user(conn, username)
+
+def get_user_detached(username: str):
+    """get_user on a connection that goes straight back to the pool.
+
+    login and signup wait on bcrypt after the lookup; holding the request's
+    connection through that wait would drain the pool during a login burst.
+    """
+    with db_pool.connection() as conn:
+        return fetch_user(conn, username)
+
+class PrincipalCache:
+    """Bounded LRU of username -> user record, each entry valid for `ttl` seconds"""
+
+    def __init__(self, max_size, ttl):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.claims_trusted = 0
+
+    def get(self, username: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(username)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        user = get_user(username)
+        if user is not None:
+            # The password hash is only needed at login
+            user = {k: v for k, v in user.items() if k != "password"}
+            with self._lock:
+                self._entries[username] = (now + self._ttl, user)
+                self._entries.move_to_end(username)
+                while len(self._entries) > self._max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return user
+
+    def invalidate(self, username: str):
+        """Drop a user after their role or village changed"""
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def count_trusted(self):
+        with self._lock:
+            self.claims_trusted += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self._max_size,
+                "ttl_seconds": self._ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "claims_trusted": self.claims_trusted
+            }
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+
+async def authenticate_user(username: str, password: str):
+    user = await run_in_threadpool(get_user_detached, username)
+    if not user or not await password_hasher.verify(password, user["password"]):
         return None
     return user
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+def decode_token(token: str) -> dict:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -378,46 +1351,73 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             
     except JWTError:
         raise credentials_exception
-    
-    # At this point, username is guaranteed to be a string
-    user = get_user(username)
+    return payload
+
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    payload = decode_token(token)
+    user = principal_cache.get(payload["sub"])
     
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
         
     return user
 
+def get_reader(token: str = Depends(oauth2_scheme)):
+    """get_current_user for read-only routes, trusting the token's claims if AUTH_TRUST_CLAIMS is set"""
+    if AUTH_TRUST_CLAIMS:
+        payload = decode_token(token)
+        # Tokens issued before role was a claim still go through the lookup
+        if "role" in payload:
+            principal_cache.count_trusted()
+            return {"username": payload["sub"], "role": payload["role"], "village": payload.get("village")}
+    return get_current_user(token)
+
 def require_admin(user: dict = Depends(get_current_user)):
     if user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admins only")
     return user
 
+def require_admin_reader(user: dict = Depends(get_reader)):
+    """require_admin for read-only routes"""
+    return require_admin(user)
+
 # -------------------- AUTH ROUTES --------------------
+def insert_user(user: UserCreate, hashed_pw: str):
+    try:
+        with db_pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO users (username, password, role, village) VALUES (?, ?, ?, ?)",
+                (user.username, hashed_pw, "admin", user.village)
+            )
+            conn.commit()
+        principal_cache.invalidate(user.username)
+    except sqlite3.IntegrityError as exc:
+        # Convert DB integrity errors (e.g., role CHECK) into 400s
+        raise HTTPException(status_code=400, detail="Invalid user data: " + str(exc))
+
+# login and signup are async so that waiting on bcrypt does not hold one of
+# the request threadpool's threads; the DB calls still run in the threadpool
 @app.post("/signup")
-def signup(user: UserCreate):
-    if get_user(user.username):
+async def signup(user: UserCreate):
+    if await run_in_threadpool(get_user_detached, user.username):
         raise HTTPException(status_code=400, detail="Username already exists")
     try:
-        hashed_pw = get_password_hash(user.password)
+        hashed_pw = await password_hasher.hash(user.password)
+    except HTTPException:
+        raise
     except Exception as exc:
         # Typically occurs if bcrypt backend isn't installed
         raise HTTPException(status_code=500, detail=f"Password hashing failed: {type(exc).__name__}")
-    try:
-        conn = get_db_connection()
-        conn.execute(
-            "INSERT INTO users (username, password, role, village) VALUES (?, ?, ?, ?)",
-            (user.username, hashed_pw, "admin", user.village)
-        )
-        conn.commit()
-        conn.close()
-    except sqlite3.IntegrityError as exc:
-        # Convert DB integrity errors (e.g., role CHECK) into 400s
-        raise HTTPException(status_code=400, detail="Invalid user data: " + str(exc))
+    await run_in_threadpool(insert_user, user, hashed_pw)
     return {"msg": "User created successfully"}
 
 @app.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     access_token = create_access_token(
@@ -426,28 +1426,658 @@ def login(form_data: OAuth2PasswordRequestForm = Depends()):
     return {"access_token": access_token, "token_type": "bearer"}
 
 # -------------------- HELPERS --------------------
-def check_alerts(sensor: SensorReading):
-    alerts = []
-    level = None
-    if sensor.ph < 6.5 or sensor.ph > 8.5 or sensor.turbidity > 10 or sensor.tds > 500:
-        level = "danger"
-    elif 5 < sensor.turbidity <= 10 or 300 < sensor.tds <= 500:
-        level = "warning"
-    if level:
-        alert_id = str(uuid4())
-        message = f"Water issue detected in {sensor.village} (pH={sensor.ph}, Turbidity={sensor.turbidity}, TDS={sensor.tds})"
-        conn = get_db_connection()
-        conn.execute("""
-            INSERT OR REPLACE INTO alerts (id, sensor_id, message, level, timestamp, acknowledged)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (alert_id, sensor.id, message, level, datetime.utcnow().isoformat(), 0))
-        conn.commit()
-        conn.close()
-        alerts.append({
-            "id": alert_id, "sensorId": sensor.id, "message": message,
-            "level": level, "timestamp": datetime.utcnow().isoformat(), "acknowledged": False
-        })
-    return alerts
+def alert_message(village, ph, turbidity, tds):
+    return f"Water issue detected in {village} (pH={ph}, Turbidity={turbidity}, TDS={tds})"
+
+def evaluate_alerts(stamped: List[tuple]) -> List[Optional[dict]]:
+    """Build the alert each (reading, timestamp) should raise (None if within limits) in one rules pass"""
+    if not stamped:
+        return []
+    readings = [r for r, _ in stamped]
+    levels = alert_rules.levels(
+        [[r.temperature, r.ph, r.turbidity, r.tds] for r in readings],
+        villages=[r.village for r in readings],
+        types=[r.type for r in readings]
+    )
+    return [
+        None if level is None else {
+            "id": str(uuid4()), "sensorId": r.id, "message": alert_message(r.village, r.ph, r.turbidity, r.tds),
+            "level": level, "timestamp": timestamp, "acknowledged": False, "clearedAt": None
+        }
+        for (r, timestamp), level in zip(stamped, levels)
+    ]
+
+def save_alerts(conn, alerts: List[dict]):
+    """Store alert transitions from AlertEngine (caller commits).
+
+    New alerts are inserted; a cleared alert only gets its cleared_at set, so
+    an acknowledgement made in the meantime is kept.
+    """
+    conn.executemany("""
+        INSERT INTO alerts (id, sensor_id, message, level, timestamp, acknowledged, cleared_at)
+        VALUES (?, ?, ?, ?, ?, 0, ?)
+        ON CONFLICT(id) DO UPDATE SET cleared_at = excluded.cleared_at
+    """, [(a["id"], a["sensorId"], a["message"], a["level"], a["timestamp"], a["clearedAt"]) for a in alerts])
+
+ALERT_SEVERITY = {level: severity for severity, level in enumerate(ALERT_LEVELS) if level}
+
+class AlertEngine:
+    """Per-sensor alert state, so a stuck probe raises one alert instead of one per reading.
+
+    observe() returns the transitions a reading causes, without touching the
+    database: a new alert when the sensor goes out of range, escalates or is
+    still out of range after `cooldown` seconds (the alert it replaces comes
+    back with clearedAt set), and the open alert with clearedAt set once
+    `clear_readings` readings in a row are back in range. Each worker keeps
+    its own state. Routes use observing(), which undoes the state change when
+    the write that should persist the transitions fails.
+    """
+
+    def __init__(self, cooldown, clear_readings):
+        self._cooldown = cooldown
+        self._clear_readings = max(1, clear_readings)
+        self._lock = threading.Lock()
+        # sensor id -> [open alert, raised at (monotonic), in-range readings since]
+        self._open = {}
+        self.raised = 0
+        self.escalated = 0
+        self.reraised = 0
+        self.cleared = 0
+        self.suppressed = 0
+
+    def load(self, conn):
+        """Resume after a restart from each sensor's newest alert, if it is still open.
+
+        Only the newest alert counts: older rows may predate cleared_at and
+        never be cleared. One indexed lookup per sensor keeps this off the
+        full alerts table.
+        """
+        rows = conn.execute("""
+            SELECT a.id, a.sensor_id, a.message, a.level, a.timestamp, a.acknowledged
+            FROM sensor_data s JOIN alerts a ON a.id = (
+                SELECT id FROM alerts WHERE sensor_id = s.id ORDER BY timestamp DESC, rowid DESC LIMIT 1
+            )
+            WHERE a.cleared_at IS NULL
+        """).fetchall()
+        now, utcnow = time.monotonic(), datetime.utcnow()
+        state = {}
+        for row in rows:
+            if row[3] not in ALERT_SEVERITY:
+                continue
+            try:
+                age = (utcnow - datetime.fromisoformat(row[4])).total_seconds()
+            except (TypeError, ValueError):
+                continue
+            alert = {
+                "id": row[0], "sensorId": row[1], "message": row[2], "level": row[3],
+                "timestamp": row[4], "acknowledged": bool(row[5]), "clearedAt": None
+            }
+            state[row[1]] = [alert, now - age, 0]
+        with self._lock:
+            self._open = state
+
+    def observe(self, reading: SensorReading, timestamp: str) -> List[dict]:
+        return self.observe_many([(reading, timestamp)])[0]
+
+    def observe_many(self, stamped: List[tuple], journal: Optional[list] = None) -> List[List[dict]]:
+        """Transitions for each (reading, timestamp), in order; the rules run once for the batch"""
+        alerts = evaluate_alerts(stamped)
+        now = time.monotonic()
+        with self._lock:
+            return [
+                self._transition(reading, alert, timestamp, now, journal)
+                for (reading, timestamp), alert in zip(stamped, alerts)
+            ]
+
+    @contextmanager
+    def observing(self, stamped: List[tuple], journal: Optional[list] = None):
+        """observe_many() for a block that persists the transitions. If the block
+        raises, the sensors go back to their earlier state so the next reading
+        raises the lost alert again instead of being suppressed. Pass `journal`
+        to keep the changes for a later undo(), e.g. when a queued write fails."""
+        journal = [] if journal is None else journal
+        transitions = self.observe_many(stamped, journal)
+        try:
+            yield transitions
+        except BaseException:
+            self.undo(journal)
+            raise
+
+    def undo(self, journal):
+        """Revert the state changes recorded in `journal` by observe_many()"""
+        with self._lock:
+            for sensor_id, before, after in reversed(journal):
+                # Leave the sensor alone if a later reading has moved it on
+                if self._open.get(sensor_id) is not after:
+                    continue
+                if before is None:
+                    del self._open[sensor_id]
+                else:
+                    self._open[sensor_id] = before
+
+    def _transition(self, reading, alert, timestamp, now, journal=None):
+        """Advance one sensor's state (caller holds the lock). States are
+        replaced rather than edited so undo() can tell whether they moved on."""
+        state = self._open.get(reading.id)
+        if alert is None:
+            if state is None:
+                return []
+            if state[2] + 1 < self._clear_readings:
+                self._set(reading.id, [state[0], state[1], state[2] + 1], journal)
+                return []
+            self._set(reading.id, None, journal)
+            self.cleared += 1
+            return [dict(state[0], clearedAt=timestamp)]
+
+        if state is None:
+            self.raised += 1
+            transitions = [alert]
+        else:
+            if ALERT_SEVERITY[alert["level"]] > ALERT_SEVERITY[state[0]["level"]]:
+                self.escalated += 1
+            elif now - state[1] >= self._cooldown:
+                self.reraised += 1
+            else:
+                self.suppressed += 1
+                if state[2]:
+                    self._set(reading.id, [state[0], state[1], 0], journal)
+                return []
+            transitions = [dict(state[0], clearedAt=timestamp), alert]
+        self._set(reading.id, [alert, now, 0], journal)
+        return transitions
+
+    def _set(self, sensor_id, state, journal):
+        if journal is not None:
+            journal.append((sensor_id, self._open.get(sensor_id), state))
+        if state is None:
+            self._open.pop(sensor_id, None)
+        else:
+            self._open[sensor_id] = state
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open": len(self._open),
+                "raised": self.raised,
+                "escalated": self.escalated,
+                "reraised": self.reraised,
+                "cleared": self.cleared,
+                "suppressed": self.suppressed
+            }
+
+alert_engine = AlertEngine(ALERT_COOLDOWN, ALERT_CLEAR_READINGS)
+
+@app.on_event("startup")
+def load_alert_state():
+    try:
+        with db_pool.connection() as conn:
+            alert_engine.load(conn)
+    except Exception as e:
+        print(f"Error loading alert state: {e}")
+
+PREDICTION_COLUMNS = [
+    "reading_at", "is_safe", "safety_confidence", "risk_level",
+    "predicted_disease", "disease_confidence", "model_version"
+]
+
+def prediction_from_row(r):
+    """Inline /sensors prediction, shaped like the /predict response"""
+    return {
+        "reading_at": r[0],
+        "water_safety": {"is_safe": bool(r[1]), "confidence": r[2], "risk_level": r[3], "model_version": r[6]},
+        "disease_prediction": {"predicted_disease": r[4], "confidence": r[5], "model_version": r[6]}
+    }
+
+class SensorStateCache:
+    """In-memory copy of sensor_data in the shape /sensors returns.
+
+    Ingest paths call apply() after committing, which bumps `version`; the
+    version (plus a per-process token) is the ETag of /sensors. Per-village
+    lists are built once per version and shared between requests. Each
+    sensor also carries its latest stored prediction, updated by
+    apply_predictions() as the scoring worker catches up. Updates that land
+    while a reload is querying the database are merged into the reloaded
+    snapshot rather than overwritten by it.
+    """
+
+    def __init__(self, refresh_interval):
+        self._refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._sensors = None
+        # Updates applied before the first load finished, merged in by _reload
+        self._unloaded = {}
+        self._changes = 0
+        self._views = {}
+        self._loaded_at = 0.0
+        self._token = uuid4().hex[:8]
+        self.version = 0
+        self.reloads = 0
+        self.not_modified = 0
+
+    @staticmethod
+    def _from_row(r):
+        return {
+            "id": r[0], "village": r[1],
+            "location": {"lat": r[2], "lng": r[3]},
+            "status": r[8], "last_updated": r[9],
+            "readings": {"temperature": r[4], "ph": r[5], "turbidity": r[6], "tds": r[7]},
+            "metadata": {"name": r[10], "type": r[11], "manufacturer": r[12]},
+            "prediction": prediction_from_row(r[13:]) if r[13] is not None else None
+        }
+
+    def _stale(self):
+        return self._sensors is None or time.monotonic() - self._loaded_at > self._refresh_interval
+
+    @staticmethod
+    def _newer(loaded, current):
+        """Merge a reloaded sensor with the in-memory one, keeping the newer reading and prediction"""
+        if loaded is None:
+            return current
+        newest = current if (current["last_updated"] or "") > (loaded["last_updated"] or "") else loaded
+        predictions = [p for p in (loaded["prediction"], current["prediction"]) if p is not None]
+        prediction = max(predictions, key=lambda p: p["reading_at"]) if predictions else None
+        return newest if newest["prediction"] is prediction else dict(newest, prediction=prediction)
+
+    def _reload(self):
+        # One reload at a time; whoever waited finds the snapshot fresh and returns
+        with self._reload_lock:
+            if not self._stale():
+                return
+            self._reload_locked()
+
+    def _reload_locked(self):
+        with self._lock:
+            changes = self._changes
+        # Reuses the request's connection, so a stale /sensors call holds one pool slot
+        with db_connection() as conn:
+            rows = conn.execute("""
+                SELECT d.id, d.village, d.lat, d.lng, d.temperature, d.ph, d.turbidity, d.tds, d.status,
+                       d.last_updated, d.name, d.type, d.manufacturer, {}
+                FROM sensor_data d
+                LEFT JOIN predictions p ON p.sensor_id = d.id
+                    AND p.reading_at = (SELECT MAX(reading_at) FROM predictions WHERE sensor_id = d.id)
+            """.format(", ".join(f"p.{c}" for c in PREDICTION_COLUMNS))).fetchall()
+        sensors = {r[0]: self._from_row(r) for r in rows}
+        with self._lock:
+            if self._changes != changes:
+                # apply()/apply_predictions() ran during the query, which may
+                # not have seen what they wrote
+                current = self._sensors if self._sensors is not None else self._unloaded
+                for sensor_id, sensor in current.items():
+                    sensors[sensor_id] = self._newer(sensors.get(sensor_id), sensor)
+            self._unloaded = {}
+            self._loaded_at = time.monotonic()
+            self.reloads += 1
+            if sensors != self._sensors:
+                self._sensors = sensors
+                self._views = {}
+                self.version += 1
+
+    def apply(self, readings: List[tuple]):
+        """Fold committed (SensorReading, timestamp) pairs into the snapshot"""
+        with self._lock:
+            self._changes += 1
+            # Before the first load, only keep the update for the load to merge
+            target = self._sensors if self._sensors is not None else self._unloaded
+            for r, ts in readings:
+                # Keep showing the last prediction until this reading is scored
+                previous = target.get(r.id)
+                target[r.id] = {
+                    "id": r.id, "village": r.village,
+                    "location": {"lat": r.lat, "lng": r.lng},
+                    "status": "online", "last_updated": ts,
+                    "readings": {"temperature": r.temperature, "ph": r.ph, "turbidity": r.turbidity, "tds": r.tds},
+                    "metadata": {"name": r.name, "type": r.type, "manufacturer": r.manufacturer},
+                    "prediction": previous["prediction"] if previous else None
+                }
+            if self._sensors is not None:
+                self._views = {}
+                self.version += 1
+
+    def apply_predictions(self, predictions: List[tuple]):
+        """Attach stored (sensor id, prediction) pairs unless the sensor already shows a newer one"""
+        with self._lock:
+            self._changes += 1
+            target = self._sensors if self._sensors is not None else self._unloaded
+            changed = False
+            for sensor_id, prediction in predictions:
+                sensor = target.get(sensor_id)
+                if sensor is None:
+                    continue
+                current = sensor["prediction"]
+                if current is not None and current["reading_at"] > prediction["reading_at"]:
+                    continue
+                # Replace rather than mutate, views handed out earlier may still be serializing
+                target[sensor_id] = dict(sensor, prediction=prediction)
+                changed = True
+            if changed and self._sensors is not None:
+                self._views = {}
+                self.version += 1
+
+    def get(self, village: Optional[str] = None):
+        """Return (etag, sensors) for all sensors, or only those in `village`"""
+        if self._stale():
+            self._reload()
+        with self._lock:
+            view = self._views.get(village)
+            if view is None:
+                sensors = self._sensors.values()
+                view = [s for s in sensors if s["village"] == village] if village is not None else list(sensors)
+                self._views[village] = view
+            # Different villages get different bodies at the same version
+            scope = f"-{zlib.crc32(village.encode()):08x}" if village is not None else ""
+            return f'"{self._token}-{self.version}{scope}"', view
+
+    def village_of(self, sensor_id: str, load: bool = True) -> Optional[str]:
+        """Village of a known sensor; with load=False never touches the database"""
+        if load and self._sensors is None:
+            self._reload()
+        with self._lock:
+            sensor = (self._sensors or {}).get(sensor_id)
+            return sensor["village"] if sensor else None
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "sensors": len(self._sensors or {}),
+                "reloads": self.reloads,
+                "not_modified": self.not_modified
+            }
+
+sensor_state = SensorStateCache(SENSOR_CACHE_REFRESH)
+
+@app.on_event("startup")
+def warm_up_sensor_state():
+    """Load the snapshot up front; websocket routing of alerts reads it without loading"""
+    try:
+        sensor_state.get()
+    except Exception as e:
+        print(f"Error loading sensor state: {e}")
+
+def write_readings(conn, readings: List[tuple]):
+    """Upsert the latest state per sensor and append every reading to history (caller commits).
+
+    `readings` is a list of (SensorReading, timestamp) pairs in arrival order.
+    """
+    # Only the last reading of each sensor in the batch decides its latest state
+    latest = {r.id: (r, ts) for r, ts in readings}
+    conn.executemany("""
+        INSERT OR REPLACE INTO sensor_data
+        (id, village, lat, lng, temperature, ph, turbidity, tds, status, last_updated, name, type, manufacturer)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(r.id, r.village, r.lat, r.lng, r.temperature, r.ph, r.turbidity, r.tds, "online", ts, r.name, r.type, r.manufacturer) for r, ts in latest.values()])
+    conn.executemany("""
+        INSERT INTO sensor_history (sensor_id, village, temperature, ph, turbidity, tds, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [(r.id, r.village, r.temperature, r.ph, r.turbidity, r.tds, ts) for r, ts in readings])
+    update_rollups(conn, readings)
+
+class IngestBuffer:
+    """Write-behind queue for sensor readings.
+
+    Handlers put readings (and the alerts they raised) on a bounded queue and
+    return straight away; one background thread writes them to the database
+    in batches of up to `flush_rows`, or whatever arrived within
+    `flush_interval` seconds. When the queue is full, submit() waits up to
+    `enqueue_timeout` and then answers 503 so devices back off.
+    """
+
+    def __init__(self, max_size, flush_rows, flush_interval, enqueue_timeout, max_retries=3):
+        self._queue = queue.Queue(maxsize=max_size)
+        self._flush_rows = flush_rows
+        self._flush_interval = flush_interval
+        self._enqueue_timeout = enqueue_timeout
+        self._max_retries = max_retries
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.max_size = max_size
+        self.enqueued = 0
+        self.rejected = 0
+        self.flushed_rows = 0
+        self.dropped_rows = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ingest-buffer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=30.0):
+        """Flush everything still queued and stop the writer thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, reading: SensorReading, timestamp: str, alerts: List[dict] = (), journal: Optional[list] = None):
+        """Queue a reading; `journal` is the alert engine's record of the
+        state change, undone if the reading is dropped"""
+        try:
+            self._queue.put((reading, timestamp, list(alerts), journal), timeout=self._enqueue_timeout)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise HTTPException(status_code=503, detail="Ingest queue full, retry later", headers={"Retry-After": "1"})
+        with self._lock:
+            self.enqueued += 1
+
+    def _next_batch(self):
+        """Block for the first item, then collect more until the batch is full or the interval ends"""
+        try:
+            batch = [self._queue.get(timeout=self._flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self._flush_interval
+        while len(batch) < self._flush_rows:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0 or self._stop.is_set():
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush(self, batch):
+        readings = [(reading, timestamp) for reading, timestamp, _, _ in batch]
+        alerts = [a for _, _, item_alerts, _ in batch for a in item_alerts]
+        for attempt in range(1, self._max_retries + 1):
+            start = time.perf_counter()
+            try:
+                with db_pool.connection() as conn:
+                    write_readings(conn, readings)
+                    save_alerts(conn, alerts)
+                    conn.commit()
+            except Exception as exc:
+                print(f"Ingest flush of {len(batch)} readings failed (attempt {attempt}): {exc}")
+                if attempt < self._max_retries:
+                    time.sleep(0.5 * attempt)
+                continue
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.flushes += 1
+                self.flushed_rows += len(batch)
+                self.last_flush_ms = elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+                self._total_flush_ms += elapsed_ms
+            # Outside the retry loop: the rows are committed, a failure here must not write them twice
+            try:
+                sensor_state.apply(readings)
+                if scoring_worker is not None:
+                    scoring_worker.submit(readings)
+            except Exception as exc:
+                print(f"Applying {len(batch)} flushed readings failed: {exc}")
+            return
+        with self._lock:
+            self.dropped_rows += len(batch)
+        # The alerts were never stored, so let the next readings raise them again
+        for _, _, _, journal in reversed(batch):
+            if journal:
+                alert_engine.undo(journal)
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "depth": self._queue.qsize(),
+                "capacity": self.max_size,
+                "enqueued": self.enqueued,
+                "rejected": self.rejected,
+                "flushed_rows": self.flushed_rows,
+                "dropped_rows": self.dropped_rows,
+                "flushes": self.flushes,
+                "last_flush_ms": self.last_flush_ms,
+                "avg_flush_ms": self._total_flush_ms / self.flushes if self.flushes else 0.0,
+                "max_flush_ms": self.max_flush_ms,
+            }
+
+ingest_buffer = IngestBuffer(
+    INGEST_QUEUE_SIZE, INGEST_FLUSH_ROWS, INGEST_FLUSH_MS / 1000, INGEST_ENQUEUE_TIMEOUT
+) if INGEST_WRITE_BEHIND else None
+
+@app.on_event("startup")
+def start_ingest_buffer():
+    if ingest_buffer is not None:
+        ingest_buffer.start()
+
+@app.on_event("shutdown")
+def drain_ingest_buffer():
+    if ingest_buffer is not None:
+        ingest_buffer.stop()
+
+class ScoringWorker:
+    """Scores ingested readings in the background and stores the predictions.
+
+    Ingest paths hand over committed (SensorReading, timestamp) pairs with
+    submit(), which never blocks: when the queue is full the readings go
+    unscored and their sensors keep the previous prediction. One thread
+    runs up to `batch_rows` readings through the inference pipeline per
+    call, writes them to `predictions` and attaches them to sensor_state.
+    """
+
+    def __init__(self, max_size, batch_rows, batch_interval):
+        self._queue = queue.Queue(maxsize=max_size)
+        self._batch_rows = batch_rows
+        self._batch_interval = batch_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.max_size = max_size
+        self.scored = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="scoring-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, readings: List[tuple]):
+        dropped = 0
+        for item in readings:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                dropped += 1
+        if dropped:
+            with self._lock:
+                self.dropped += dropped
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self._batch_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self._batch_interval
+        while len(batch) < self._batch_rows:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _score(self, batch):
+        results = inference_pipeline.predict_many([[r.temperature, r.ph, r.turbidity, r.tds] for r, _ in batch])
+        scored_at = datetime.utcnow().isoformat()
+        rows = [
+            (r.id, ts, int(p["water_safety"]["is_safe"]), p["water_safety"]["confidence"], p["water_safety"]["risk_level"],
+             p["disease_prediction"]["predicted_disease"], p["disease_prediction"]["confidence"],
+             p["water_safety"]["model_version"], scored_at)
+            for (r, ts), p in zip(batch, results)
+        ]
+        with db_pool.connection() as conn:
+            conn.executemany(f"""
+                INSERT OR REPLACE INTO predictions (sensor_id, {", ".join(PREDICTION_COLUMNS)}, scored_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.commit()
+        sensor_state.apply_predictions([(row[0], prediction_from_row(row[1:8])) for row in rows])
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._score(batch)
+            except Exception as exc:
+                print(f"Scoring {len(batch)} readings failed: {exc}")
+                with self._lock:
+                    self.failed += len(batch)
+                continue
+            with self._lock:
+                self.scored += len(batch)
+                self.batches += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "depth": self._queue.qsize(),
+                "capacity": self.max_size,
+                "scored": self.scored,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "batches": self.batches,
+                "avg_batch_rows": self.scored / self.batches if self.batches else 0.0
+            }
+
+scoring_worker = ScoringWorker(
+    PREDICT_QUEUE_SIZE, PREDICT_BATCH_ROWS, PREDICT_BATCH_MS / 1000
+) if PREDICT_ON_INGEST else None
+
+@app.on_event("startup")
+def start_scoring_worker():
+    if scoring_worker is not None:
+        scoring_worker.start()
+
+@app.on_event("shutdown")
+def stop_scoring_worker():
+    if scoring_worker is not None:
+        scoring_worker.stop()
 
 # -------------------- ROUTES --------------------
 @app.get("/")
@@ -456,82 +2086,59 @@ def root():
 
 # ---- Auth utils ----
 @app.get("/me")
-def get_me(user: dict = Depends(get_current_user)):
+def get_me(user: dict = Depends(get_reader)):
     return {"username": user.get("username"), "role": user.get("role"), "village": user.get("village")}
 
 # ---- Sensors ----
+def publish_readings(readings: List[SensorReading], alerts: List[dict]):
+    """Broadcast sensor updates and the alerts they raised or cleared.
+
+    Alert events carry the reading's village so they route to village
+    subscribers even before the sensor reaches the state snapshot.
+    """
+    villages = {}
+    for reading in readings:
+        villages[reading.id] = reading.village
+        event_bus.publish({"type": "sensor_update", "sensor": reading.dict()})
+    for a in alerts:
+        event_bus.publish({"type": "alert", "alert": a, "village": villages.get(a["sensorId"])})
+
 @app.post("/sensor_data")
 def add_sensor_data(sensor: SensorReading, user: dict = Depends(get_current_user)):
     now = datetime.utcnow().isoformat()
-    conn = get_db_connection()
-    conn.execute("""
-        INSERT OR REPLACE INTO sensor_data
-        (id, village, lat, lng, temperature, ph, turbidity, tds, status, last_updated, name, type, manufacturer)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (sensor.id, sensor.village, sensor.lat, sensor.lng, sensor.temperature, sensor.ph, sensor.turbidity, sensor.tds, "online", now, sensor.name, sensor.type, sensor.manufacturer))
-    conn.execute("""
-        INSERT INTO sensor_history (sensor_id, village, temperature, ph, turbidity, tds, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (sensor.id, sensor.village, sensor.temperature, sensor.ph, sensor.turbidity, sensor.tds, now))
-    conn.commit()
-    conn.close()
-    alerts = check_alerts(sensor)
+    with alert_engine.observing([(sensor, now)]) as (alerts,):
+        with db_connection() as conn:
+            write_readings(conn, [(sensor, now)])
+            save_alerts(conn, alerts)
+            conn.commit()
+    sensor_state.apply([(sensor, now)])
+    if scoring_worker is not None:
+        scoring_worker.submit([(sensor, now)])
     # broadcast live update
-    try:
-        import asyncio as _asyncio
-        _asyncio.create_task(manager.broadcast({"type": "sensor_update", "sensor": sensor.dict()}))
-        for a in alerts:
-            _asyncio.create_task(manager.broadcast({"type": "alert", "alert": a}))
-    except Exception:
-        pass
+    publish_readings([sensor], alerts)
     return {"status": "ok", "alerts_generated": alerts}
 
 @app.post("/public/sensor_data")
 def add_sensor_data_public(sensor: SensorReading):
     now = datetime.utcnow().isoformat()
-    conn = get_db_connection()
-    conn.execute(
-        """
-        INSERT OR REPLACE INTO sensor_data
-        (id, village, lat, lng, temperature, ph, turbidity, tds, status, last_updated, name, type, manufacturer)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (sensor.id, sensor.village, sensor.lat, sensor.lng, sensor.temperature, sensor.ph, sensor.turbidity, sensor.tds, "online", now, getattr(sensor, 'name', None), getattr(sensor, 'type', None), getattr(sensor, 'manufacturer', None))
-    )
-    conn.execute(
-        """
-        INSERT INTO sensor_history (sensor_id, village, temperature, ph, turbidity, tds, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        """,
-        (sensor.id, sensor.village, sensor.temperature, sensor.ph, sensor.turbidity, sensor.tds, now)
-    )
-    conn.commit()
-    conn.close()
-    
-    # Only generate alerts every minute for ESP32 sensors to avoid spam
-    alerts = []
-    if sensor.id == "SEN-ESP32-001":  # Only for VIT-AP ESP32 sensor
-        # Check if we should generate alert (every minute)
-        conn = get_db_connection()
-        recent_alert = conn.execute("""
-            SELECT timestamp FROM alerts 
-            WHERE sensor_id = ? AND timestamp > datetime('now', '-1 minute')
-            ORDER BY timestamp DESC LIMIT 1
-        """, (sensor.id,)).fetchone()
-        conn.close()
-        
-        # Only generate alert if no alert was generated in the last minute
-        if not recent_alert:
-            alerts = check_alerts(sensor)
+
+    if ingest_buffer is not None:
+        # Write-behind mode: acknowledge now, the buffer writes in the background
+        journal = []
+        with alert_engine.observing([(sensor, now)], journal) as (alerts,):
+            ingest_buffer.submit(sensor, now, alerts, journal)
+    else:
+        with alert_engine.observing([(sensor, now)]) as (alerts,):
+            with db_connection() as conn:
+                write_readings(conn, [(sensor, now)])
+                save_alerts(conn, alerts)
+                conn.commit()
+        sensor_state.apply([(sensor, now)])
+        if scoring_worker is not None:
+            scoring_worker.submit([(sensor, now)])
     
     # broadcast
-    try:
-        import asyncio as _asyncio
-        _asyncio.create_task(manager.broadcast({"type": "sensor_update", "sensor": sensor.dict()}))
-        for a in alerts:
-            _asyncio.create_task(manager.broadcast({"type": "alert", "alert": a}))
-    except Exception:
-        pass
+    publish_readings([sensor], alerts)
     return {"status": "ok", "alerts_generated": alerts}
 
 # Add a simple endpoint for ESP32 to use /data (for backward compatibility)
@@ -540,101 +2147,385 @@ def add_esp32_data(sensor: SensorReading):
     """Backward compatibility endpoint for ESP32"""
     return add_sensor_data_public(sensor)
 
+def ingest_batch(items: List[Any]):
+    """Validate, store and alert on a batch of readings in one transaction"""
+    if len(items) > MAX_INGEST_BATCH:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_INGEST_BATCH} readings)")
+    start = datetime.utcnow()
+
+    results = []
+    readings = []
+    for index, item in enumerate(items):
+        try:
+            reading = SensorReading(**item)
+        except (ValidationError, TypeError) as exc:
+            results.append({"index": index, "status": "error", "detail": str(exc)})
+            continue
+        readings.append(reading)
+        results.append({"index": index, "id": reading.id, "status": "ok", "alerts_generated": []})
+
+    accepted = [r for r in results if r["status"] == "ok"]
+    # One microsecond apart, in order, so repeated readings of a sensor keep
+    # distinct (sensor_id, reading_at) keys in the history and predictions
+    stamped = [(r, (start + timedelta(microseconds=i)).isoformat()) for i, r in enumerate(readings)]
+    alerts = []
+    with alert_engine.observing(stamped) as observed:
+        for result, transitions in zip(accepted, observed):
+            alerts.extend(transitions)
+            result["alerts_generated"].extend(transitions)
+        if readings:
+            with db_connection() as conn:
+                write_readings(conn, stamped)
+                save_alerts(conn, alerts)
+                conn.commit()
+
+    if readings:
+        sensor_state.apply(stamped)
+        if scoring_worker is not None:
+            scoring_worker.submit(stamped)
+
+    # broadcast live updates
+    publish_readings(readings, alerts)
+    return {"status": "ok", "accepted": len(readings), "rejected": len(results) - len(readings), "results": results}
+
+@app.post("/sensor_data/batch")
+def add_sensor_data_batch(items: List[Any] = Body(...), user: dict = Depends(get_current_user)):
+    """Store many readings (e.g. from a gateway) in a single transaction"""
+    return ingest_batch(items)
+
+@app.post("/public/sensor_data/batch")
+def add_sensor_data_batch_public(items: List[Any] = Body(...)):
+    """Unauthenticated batch ingest for gateways, same as /sensor_data/batch"""
+    return ingest_batch(items)
+
 @app.get("/sensors")
-def get_sensors(user: dict = Depends(get_current_user)):
-    conn = get_db_connection()
+def get_sensors(request: Request, response: Response, user: dict = Depends(get_reader)):
     user_village = user.get("village")
     if user["role"] == "admin" or user_village in (None, "", "null"):
-        rows = conn.execute("SELECT * FROM sensor_data").fetchall()
-    else:
-        rows = conn.execute("SELECT * FROM sensor_data WHERE village=?", (user_village,)).fetchall()
-    conn.close()
-    sensors = []
-    for r in rows:
-        sensors.append({
-            "id": r[0], "village": r[1],
-            "location": {"lat": r[2], "lng": r[3]},
-            "status": r[8], "last_updated": r[9],
-            "readings": {"temperature": r[4], "ph": r[5], "turbidity": r[6], "tds": r[7]},
-            "metadata": {"name": r[10], "type": r[11], "manufacturer": r[12]}
-        })
+        user_village = None
+    etag, sensors = sensor_state.get(user_village)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        sensor_state.count_not_modified()
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
     return {"sensors": sensors}
 
+ENTITY_TAG = re.compile(r'\s*(?:W/)?("[^"]*")\s*(?:,|$)')
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match check per RFC 9110: "*" or any listed tag, compared weakly"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in ENTITY_TAG.findall(header)
+
+def parse_time_bound(value: Optional[str], end: bool = False) -> Optional[datetime]:
+    """Parse a YYYY-MM-DD or ISO datetime query parameter into naive UTC"""
+    if not value:
+        return None
+    try:
+        if len(value) == 10:
+            return datetime.fromisoformat(value + ("T23:59:59.999999" if end else "T00:00:00"))
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Invalid date: {value}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def pick_resolution(start: Optional[datetime], end: datetime) -> str:
+    """Coarsest rollup that still yields HISTORY_AUTO_POINTS buckets over the window"""
+    if start is None:
+        return "raw"
+    span = (end - start).total_seconds()
+    for resolution in ("day", "hour", "minute"):
+        if span / ROLLUPS[resolution][3] >= HISTORY_AUTO_POINTS:
+            return resolution
+    return "raw"
+
+def parse_bucket(value: str) -> int:
+    """Bucket width such as 30s, 15m, 6h or 1d, in seconds"""
+    unit = HISTORY_BUCKET_UNITS.get(value[-1:])
+    if unit is None or not value[:-1].isdigit() or int(value[:-1]) == 0:
+        raise HTTPException(status_code=422, detail=f"Invalid bucket: {value} (use e.g. 30s, 15m, 6h, 1d)")
+    return int(value[:-1]) * unit
+
+def bucketed_history(conn, sensor_id: str, bucket: str, from_dt: Optional[datetime], to_dt: Optional[datetime], limit: int):
+    """Aggregate history into fixed-width buckets in SQL and return it column-wise"""
+    seconds = parse_bucket(bucket)
+    to_dt = to_dt or datetime.utcnow()
+    if from_dt is None:
+        from_dt = to_dt - timedelta(seconds=seconds * limit)
+    if (to_dt - from_dt).total_seconds() / seconds > HISTORY_MAX_POINTS:
+        raise HTTPException(status_code=422, detail=f"Window holds more than {HISTORY_MAX_POINTS} buckets, use a wider bucket")
+
+    # Read from the coarsest rollup whose buckets tile the requested width,
+    # raw history only for sub-minute buckets
+    source = next((res for res in ("day", "hour", "minute") if seconds % ROLLUPS[res][3] == 0), "raw")
+    if source == "raw":
+        table, column, count = "sensor_history", "created_at", "COUNT(*)"
+        aggregates = [f"AVG({m}), MIN({m}), MAX({m})" for m in ROLLUP_METRICS]
+        lower = from_dt.isoformat()
+    else:
+        table, column, count = ROLLUPS[source][0], "bucket", "SUM(samples)"
+        aggregates = [f"SUM({m}_sum) / SUM(samples), MIN({m}_min), MAX({m}_max)" for m in ROLLUP_METRICS]
+        lower = rollup_bucket(from_dt.isoformat(), source)
+    # Truncate to whole seconds before converting, strftime('%s') rounds fractions
+    epoch = f"CAST(strftime('%s', substr({column}, 1, 19)) AS INTEGER)"
+    rows = conn.execute(f"""
+        SELECT ({epoch} / ?) * ? AS b, {count}, {", ".join(aggregates)}
+        FROM {table}
+        WHERE sensor_id = ? AND {column} >= ? AND {column} <= ?
+        GROUP BY b
+        ORDER BY b
+    """, (seconds, seconds, sensor_id, lower, to_dt.isoformat())).fetchall()
+
+    columns = {
+        "timestamps": [datetime.fromtimestamp(r[0], timezone.utc).replace(tzinfo=None).isoformat() for r in rows],
+        "samples": [r[1] for r in rows],
+    }
+    for i, m in enumerate(ROLLUP_METRICS):
+        columns[m] = {
+            "mean": [r[2 + 3 * i] for r in rows],
+            "min": [r[3 + 3 * i] for r in rows],
+            "max": [r[4 + 3 * i] for r in rows],
+        }
+    return {"sensor_id": sensor_id, "bucket": bucket, "source": source, **columns}
+
 @app.get("/sensors/{sensor_id}/history")
-def get_sensor_history(sensor_id: str, user: dict = Depends(get_current_user)):
-    conn = get_db_connection()
-    # Check if user is allowed to see this sensor
-    row = conn.execute("SELECT village FROM sensor_data WHERE id=?", (sensor_id,)).fetchone()
-    if not row:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Sensor not found")
-    sensor_village = row[0]
-    if user["role"] != "admin" and sensor_village != user.get("village"):
-        conn.close()
-        raise HTTPException(status_code=403, detail="Forbidden")
-    
-    rows = conn.execute("""
-        SELECT temperature, ph, turbidity, tds, created_at 
-        FROM sensor_history 
-        WHERE sensor_id=? 
-        ORDER BY created_at DESC 
-        LIMIT 20
-    """, (sensor_id,)).fetchall()
-    conn.close()
-    history = [{"temperature": r[0], "ph": r[1], "turbidity": r[2], "tds": r[3], "timestamp": r[4]} for r in rows]
-    return {"sensor_id": sensor_id, "history": history}
+def get_sensor_history(
+    sensor_id: str,
+    resolution: Literal["raw", "minute", "hour", "day", "auto"] = "raw",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    bucket: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=HISTORY_MAX_POINTS),
+    user: dict = Depends(get_reader)
+):
+    """Sensor history as raw rows or rollups, or as fixed-width buckets in columnar form when `bucket` is set"""
+    from_dt = parse_time_bound(start)
+    to_dt = parse_time_bound(end, end=True)
+    if resolution == "auto":
+        resolution = pick_resolution(from_dt, to_dt or datetime.utcnow())
+
+    with db_connection() as conn:
+        # Check if user is allowed to see this sensor
+        row = conn.execute("SELECT village FROM sensor_data WHERE id=?", (sensor_id,)).fetchone()
+        if not row:
+            raise HTTPException(status_code=404, detail="Sensor not found")
+        sensor_village = row[0]
+        if user["role"] != "admin" and sensor_village != user.get("village"):
+            raise HTTPException(status_code=403, detail="Forbidden")
+
+        if bucket:
+            return bucketed_history(conn, sensor_id, bucket, from_dt, to_dt, limit)
+
+        if resolution == "raw":
+            column = "created_at"
+            select = "SELECT temperature, ph, turbidity, tds, created_at FROM sensor_history"
+        else:
+            column = "bucket"
+            select = f"SELECT bucket, samples, {_ROLLUP_COLUMNS} FROM {ROLLUPS[resolution][0]}"
+            # Include the partially covered bucket the window starts in
+            if from_dt is not None:
+                from_dt = rollup_bucket(from_dt.isoformat(), resolution)
+        conditions, params = ["sensor_id=?"], [sensor_id]
+        if from_dt is not None:
+            conditions.append(f"{column} >= ?")
+            params.append(from_dt if isinstance(from_dt, str) else from_dt.isoformat())
+        if to_dt is not None:
+            conditions.append(f"{column} <= ?")
+            params.append(to_dt.isoformat())
+        rows = conn.execute(
+            f"{select} WHERE {' AND '.join(conditions)} ORDER BY {column} DESC LIMIT ?",
+            (*params, limit)
+        ).fetchall()
+
+    if resolution == "raw":
+        history = [{"temperature": r[0], "ph": r[1], "turbidity": r[2], "tds": r[3], "timestamp": r[4]} for r in rows]
+    else:
+        history = []
+        for r in rows:
+            point = {"timestamp": r[0], "samples": r[1]}
+            for i, m in enumerate(ROLLUP_METRICS):
+                low, high, total = r[2 + 3 * i: 5 + 3 * i]
+                point[m] = total / r[1]
+                point[f"{m}_min"] = low
+                point[f"{m}_max"] = high
+            history.append(point)
+    return {"sensor_id": sensor_id, "resolution": resolution, "history": history}
 
 # ---- Health Reports ----
 @app.post("/health_reports")
 def add_health_report(report: HealthReport, user: dict = Depends(get_current_user)):
     now = datetime.utcnow().isoformat()
-    conn = get_db_connection()
-    conn.execute("INSERT OR REPLACE INTO health_reports (id, village, symptoms, created_at, phone) VALUES (?, ?, ?, ?, ?)",
-                (report.id, report.village, ",".join(report.symptoms), now, report.phone))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        conn.execute("INSERT OR REPLACE INTO health_reports (id, village, symptoms, created_at, phone) VALUES (?, ?, ?, ?, ?)",
+                    (report.id, report.village, ",".join(report.symptoms), now, report.phone))
+        conn.commit()
     # broadcast live
-    try:
-        import asyncio as _asyncio
-        _asyncio.create_task(manager.broadcast({"type": "health_report", "report": report.dict()}))
-    except Exception:
-        pass
+    event_bus.publish({"type": "health_report", "report": report.dict()})
     return {"status": "ok", "report": report}
 
 @app.post("/public/health_report")
 def add_public_health_report(report: PublicHealthReport):
     now = datetime.utcnow().isoformat()
     rid = report.id or str(uuid4())
-    conn = get_db_connection()
-    conn.execute(
-        "INSERT OR REPLACE INTO health_reports (id, village, symptoms, created_at, phone) VALUES (?, ?, ?, ?, ?)",
-        (rid, report.village, ",".join(report.symptoms), now, report.phone),
-    )
-    conn.commit()
-    conn.close()
-    # broadcast live (best-effort)
-    try:
-        import asyncio as _asyncio
-        _asyncio.create_task(
-            manager.broadcast({"type": "health_report", "report": {"id": rid, "village": report.village, "symptoms": report.symptoms, "created_at": now, "phone": report.phone}})
+    with db_connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO health_reports (id, village, symptoms, created_at, phone) VALUES (?, ?, ?, ?, ?)",
+            (rid, report.village, ",".join(report.symptoms), now, report.phone),
         )
-    except Exception:
-        pass
+        conn.commit()
+    # broadcast live (best-effort)
+    event_bus.publish({"type": "health_report", "report": {"id": rid, "village": report.village, "symptoms": report.symptoms, "created_at": now, "phone": report.phone}})
     return {"status": "ok", "report": {"id": rid, "village": report.village, "symptoms": report.symptoms, "created_at": now}}
 
+def visible_villages(user: dict) -> Optional[set]:
+    """Villages a user may watch, None meaning all of them (same rule as /sensors)"""
+    village = user.get("village")
+    if user["role"] == "admin" or village in (None, "", "null"):
+        return None
+    return {village}
+
+def subscription_topics(user: dict, request: dict) -> list:
+    """Validate a subscribe request against the user's villages and turn it into topics"""
+    allowed = visible_villages(user)
+    villages = request.get("villages") or []
+    sensors = request.get("sensors") or []
+    if not isinstance(villages, list) or not isinstance(sensors, list):
+        raise ValueError("villages and sensors must be lists")
+    if allowed is not None:
+        forbidden = [v for v in villages if v not in allowed]
+        forbidden += [s for s in sensors if sensor_state.village_of(s) not in allowed]
+        if forbidden:
+            raise PermissionError(f"Forbidden: {', '.join(map(str, forbidden))}")
+    topics = [("village", v) for v in villages] + [("sensor", s) for s in sensors]
+    if topics:
+        return topics
+    # No villages or sensors given: everything the user is allowed to see
+    return [ALL_TOPIC] if allowed is None else [("village", v) for v in allowed]
+
 @app.websocket("/ws")
-async def websocket_endpoint(ws: WebSocket):
-    await manager.connect(ws)
+async def websocket_endpoint(ws: WebSocket, token: Optional[str] = None):
+    """Live events. Connect with ?token=<access token>; by default a client gets
+    every event it is allowed to see, and can narrow that down by sending
+
+        {"action": "subscribe", "villages": [...], "sensors": [...], "types": [...]}
+
+    which replaces its subscription, or {"action": "unsubscribe"} to pause.
+    With WS_COALESCE_MS set, sensor updates arrive as sensor_batch frames.
+    """
+    try:
+        if not token:
+            raise HTTPException(status_code=401)
+        user = await run_in_threadpool(get_reader, token)
+    except HTTPException:
+        await ws.close(code=1008)
+        return
+    client = await manager.connect(ws, user, await run_in_threadpool(subscription_topics, user, {}))
     try:
         while True:
-            # keep alive / optional messages from client
-            await ws.receive_text()
+            try:
+                request = json.loads(await ws.receive_text())
+                action = request.get("action")
+                if action == "subscribe":
+                    types = request.get("types")
+                    if types is not None and (not isinstance(types, list) or set(types) - set(EVENT_TYPES)):
+                        raise ValueError(f"types must be a list drawn from {', '.join(EVENT_TYPES)}")
+                    topics = await run_in_threadpool(subscription_topics, user, request)
+                    manager.subscribe(client, topics, types)
+                elif action == "unsubscribe":
+                    manager.subscribe(client, ())
+                else:
+                    raise ValueError("action must be subscribe or unsubscribe")
+                manager.send(client, {
+                    "type": "subscribed",
+                    "topics": [list(t) for t in sorted(client.topics)],
+                    "types": sorted(client.types) if client.types is not None else None
+                })
+            except (ValueError, PermissionError, AttributeError) as exc:
+                manager.send(client, {"type": "error", "detail": str(exc)})
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(ws)
 
+# ---- Pagination ----
+# Listings are returned newest first in pages keyed on (sort column, id). The
+# cursor is the key of the last row sent; format=ndjson instead streams every
+# row after the cursor in chunks, for exports in constant memory. Without a
+# limit or cursor the whole listing comes back in one response, as it did
+# before paging, for clients that do not follow next_cursor
+PAGE_SIZE_DEFAULT = int(os.environ.get("PAGE_SIZE_DEFAULT", "500"))
+PAGE_SIZE_MAX = int(os.environ.get("PAGE_SIZE_MAX", "1000"))
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "1000"))
+
+def encode_cursor(sort_value: str, row_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+    return str(sort_value), str(row_id)
+
+def keyset_rows(conn, select: str, sort_column: str, conditions: list, params: list, after: Optional[tuple], limit: int):
+    """Next `limit` rows ordered by (sort_column, id) descending, strictly after the `after` key"""
+    conditions, params = list(conditions), list(params)
+    if after is not None:
+        conditions.append(f"({sort_column}, id) < (?, ?)")
+        params.extend(after)
+    where_clause = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+    return conn.execute(
+        f"{select}{where_clause} ORDER BY {sort_column} DESC, id DESC LIMIT ?", (*params, limit)
+    ).fetchall()
+
+def paginate(table: str, columns: List[str], sort_column: str, conditions: list, params: list, to_dict, name: str,
+             cursor: Optional[str], limit: Optional[int], format: str):
+    """One JSON page with a next_cursor, or an NDJSON stream of everything after the cursor"""
+    select = f"SELECT {', '.join(columns)} FROM {table}"
+    sort_index, id_index = columns.index(sort_column), columns.index("id")
+    after = decode_cursor(cursor) if cursor else None
+    key = lambda r: (r[sort_index], r[id_index])
+    if format == "ndjson":
+        def stream():
+            position = after
+            # The request's connection is held until the response is sent, so reuse it
+            with db_connection() as conn:
+                while True:
+                    rows = keyset_rows(conn, select, sort_column, conditions, params, position, EXPORT_CHUNK_ROWS)
+                    if not rows:
+                        return
+                    yield "".join(json.dumps(to_dict(r)) + "\n" for r in rows)
+                    if len(rows) < EXPORT_CHUNK_ROWS:
+                        return
+                    position = key(rows[-1])
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    if limit is None and after is None:
+        with db_connection() as conn:
+            # LIMIT -1 is no limit in SQLite
+            rows = keyset_rows(conn, select, sort_column, conditions, params, None, -1)
+        return {name: [to_dict(r) for r in rows], "next_cursor": None}
+    limit = PAGE_SIZE_DEFAULT if limit is None else limit
+    with db_connection() as conn:
+        rows = keyset_rows(conn, select, sort_column, conditions, params, after, limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {name: [to_dict(r) for r in rows], "next_cursor": encode_cursor(*key(rows[-1])) if has_more else None}
+
 @app.get("/health_reports")
-def get_health_reports(start: Optional[str] = None, end: Optional[str] = None, user: dict = Depends(get_current_user)):
-    conn = get_db_connection()
+def get_health_reports(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+    format: Literal["json", "ndjson"] = "json",
+    user: dict = Depends(get_reader)
+):
     conditions = []
     params = []
     if user["role"] != "admin" and user.get("village"):
@@ -660,32 +2551,35 @@ def get_health_reports(start: Optional[str] = None, end: Optional[str] = None, u
             params.append(to_dt.isoformat())
         except Exception:
             pass
-    where_clause = (" WHERE " + " AND ".join(conditions)) if conditions else ""
-    query = f"SELECT id, village, symptoms, created_at, phone FROM health_reports{where_clause} ORDER BY created_at DESC"
-    rows = conn.execute(query, tuple(params)).fetchall()
-    conn.close()
-    reports = [{"id": r[0], "village": r[1], "symptoms": r[2].split(","), "created_at": r[3], "phone": r[4]} for r in rows]
-    return {"health_reports": reports}
+    return paginate(
+        "health_reports", ["id", "village", "symptoms", "created_at", "phone"], "created_at", conditions, params,
+        lambda r: {"id": r[0], "village": r[1], "symptoms": r[2].split(","), "created_at": r[3], "phone": r[4]},
+        "health_reports", cursor, limit, format
+    )
 
 # ---- Alerts ----
 @app.get("/alerts")
-def get_alerts(user: dict = Depends(require_admin)):  # only admins
-    conn = get_db_connection()
-    rows = conn.execute("SELECT id, sensor_id, message, level, timestamp, acknowledged FROM alerts ORDER BY timestamp DESC").fetchall()
-    conn.close()
-    alerts = [{"id": r[0], "sensorId": r[1], "message": r[2], "level": r[3], "timestamp": r[4], "acknowledged": bool(r[5])} for r in rows]
-    return {"alerts": alerts}
+def get_alerts(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+    format: Literal["json", "ndjson"] = "json",
+    user: dict = Depends(require_admin_reader)  # only admins
+):
+    return paginate(
+        "alerts", ["id", "sensor_id", "message", "level", "timestamp", "acknowledged", "cleared_at"], "timestamp", [], [],
+        lambda r: {"id": r[0], "sensorId": r[1], "message": r[2], "level": r[3], "timestamp": r[4], "acknowledged": bool(r[5]), "clearedAt": r[6]},
+        "alerts", cursor, limit, format
+    )
 
 # ---- Admin Dashboard ----
 @app.get("/admin/dashboard")
-def admin_dashboard(user: dict = Depends(require_admin)):
-    conn = get_db_connection()
-    total_users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
-    total_sensors = conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
-    total_alerts = conn.execute("SELECT COUNT(*) FROM alerts").fetchone()[0]
-    total_health_reports = conn.execute("SELECT COUNT(*) FROM health_reports").fetchone()[0]
-    villages = [r[0] for r in conn.execute("SELECT DISTINCT village FROM users WHERE village IS NOT NULL").fetchall() if r[0] is not None]
-    conn.close()
+def admin_dashboard(user: dict = Depends(require_admin_reader)):
+    with db_connection() as conn:
+        total_users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        total_sensors = conn.execute("SELECT COUNT(*) FROM sensor_data").fetchone()[0]
+        total_alerts = conn.execute("SELECT COUNT(*) FROM alerts").fetchone()[0]
+        total_health_reports = conn.execute("SELECT COUNT(*) FROM health_reports").fetchone()[0]
+        villages = [r[0] for r in conn.execute("SELECT DISTINCT village FROM users WHERE village IS NOT NULL").fetchall() if r[0] is not None]
     return {
         "stats": {
             "users": total_users,
@@ -696,96 +2590,125 @@ def admin_dashboard(user: dict = Depends(require_admin)):
         "villages": villages
     }
 
+@app.get("/admin/metrics")
+def admin_metrics(user: dict = Depends(require_admin)):
+    """Internal counters for sizing queues, pools and caches"""
+    return {
+        "db_pool": db_pool.stats(),
+        "ingest_buffer": ingest_buffer.stats() if ingest_buffer is not None else None,
+        "scoring_worker": scoring_worker.stats() if scoring_worker is not None else None,
+        "sensor_cache": sensor_state.stats(),
+        "alerts": alert_engine.stats(),
+        "principal_cache": principal_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "event_bus": event_bus.stats(),
+        "websockets": manager.stats(),
+        "inference": inference_pipeline.stats()
+    }
+
+# ---- Alert rules ----
+@app.get("/admin/alert_rules")
+def get_alert_rules(user: dict = Depends(require_admin)):
+    """The threshold rules readings are checked against"""
+    return {"rules": alert_rules.rules}
+
+@app.get("/admin/alert_rules/replay")
+def replay_alert_rules(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    user: dict = Depends(require_admin)
+):
+    """Score stored history against the current rules, e.g. after changing thresholds.
+
+    Counts readings per level, overall and per sensor; nothing is written.
+    """
+    conditions, params = [], []
+    from_dt = parse_time_bound(start)
+    to_dt = parse_time_bound(end, end=True)
+    if from_dt is not None:
+        conditions.append("h.created_at >= ?")
+        params.append(from_dt.isoformat())
+    if to_dt is not None:
+        conditions.append("h.created_at <= ?")
+        params.append(to_dt.isoformat())
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    totals = np.zeros(len(ALERT_LEVELS), dtype=np.int64)
+    by_sensor = {}
+    with db_connection() as conn:
+        cursor = conn.execute(f"""
+            SELECT h.sensor_id, h.village, d.type, h.temperature, h.ph, h.turbidity, h.tds
+            FROM sensor_history h LEFT JOIN sensor_data d ON d.id = h.sensor_id
+            {where}
+        """, params)
+        while True:
+            rows = cursor.fetchmany(ALERT_REPLAY_CHUNK_ROWS)
+            if not rows:
+                break
+            severities = alert_rules.evaluate(
+                [r[3:] for r in rows], villages=[r[1] for r in rows], types=[r[2] for r in rows]
+            )
+            totals += np.bincount(severities, minlength=len(ALERT_LEVELS))
+            for index in np.flatnonzero(severities).tolist():
+                counts = by_sensor.setdefault(rows[index][0], dict.fromkeys(ALERT_LEVELS[1:], 0))
+                counts[ALERT_LEVELS[severities[index]]] += 1
+
+    return {
+        "readings": int(totals.sum()),
+        "levels": {level or "ok": int(count) for level, count in zip(ALERT_LEVELS, totals)},
+        "sensors": by_sensor
+    }
+
 # ---- Prediction ----
+def run_predictions(features):
+    """Run the inference pipeline, turning invalid readings into a 422"""
+    try:
+        return inference_pipeline.predict_many(features)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
 @app.post("/predict")
 def predict(data: PredictRequest, user: dict = Depends(get_current_user)):
-    if ML_MODELS_AVAILABLE:
-        # Use advanced ML models
-        safety_result = predict_water_safety(data.temperature, data.ph, data.turbidity, data.tds)
-        disease_result = predict_disease(data.temperature, data.ph, data.turbidity, data.tds)
-        
-        return {
-            "sensor_id": data.sensor_id,
-            "village": data.village,
-            "water_safety": {
-                "is_safe": safety_result["is_safe"],
-                "confidence": safety_result["confidence"],
-                "risk_level": safety_result["risk_level"]
-            },
-            "disease_prediction": {
-                "predicted_disease": disease_result["predicted_disease"],
-                "confidence": disease_result["confidence"],
-                "top_predictions": disease_result["top_predictions"]
-            }
-        }
-    else:
-        # Fallback to simple rule-based prediction
-        unsafe = data.ph < 6.5 or data.ph > 8.5 or data.turbidity > 10 or data.tds > 500
-        result = "Unsafe" if unsafe else "Safe"
-        confidence = round(random.uniform(0.7, 0.95), 2)
-        return {"sensor_id": data.sensor_id, "village": data.village, "result": result, "confidence": confidence}
+    result = run_predictions([[data.temperature, data.ph, data.turbidity, data.tds]])[0]
+    return {"sensor_id": data.sensor_id, "village": data.village, **result}
 
 @app.post("/predict/disease")
 def predict_disease_endpoint(data: PredictRequest, user: dict = Depends(get_current_user)):
     """Predict potential diseases from water quality data"""
-    if ML_MODELS_AVAILABLE:
-        disease_result = predict_disease(data.temperature, data.ph, data.turbidity, data.tds)
-        return {
-            "sensor_id": data.sensor_id,
-            "village": data.village,
-            "disease_prediction": disease_result
-        }
+    result = run_predictions([[data.temperature, data.ph, data.turbidity, data.tds]])[0]
+    return {
+        "sensor_id": data.sensor_id,
+        "village": data.village,
+        "disease_prediction": result["disease_prediction"]
+    }
+
+@app.post("/predict/batch")
+def predict_batch_endpoint(data: BatchPredictRequest, user: dict = Depends(get_current_user)):
+    """Score many readings in one vectorized pass, results in input order"""
+    if (data.rows is None) == (data.columns is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of 'rows' or 'columns'")
+    if data.rows is not None:
+        ids = [(r.sensor_id, r.village) for r in data.rows]
+        features = [[r.temperature, r.ph, r.turbidity, r.tds] for r in data.rows]
     else:
-        # Fallback prediction
-        if data.turbidity > 8 and data.ph < 6.5:
-            disease = "Gastroenteritis"
-        elif data.turbidity > 15 and data.temperature > 30:
-            disease = "Cholera"
-        elif data.tds > 800 and data.temperature > 28:
-            disease = "Typhoid"
-        elif data.ph < 6.0 and data.temperature > 32:
-            disease = "Hepatitis A"
-        elif data.turbidity > 10 and data.tds > 600:
-            disease = "Dysentery"
-        elif data.ph < 5.5 or data.ph > 9.0:
-            disease = "Skin Infection"
-        else:
-            disease = "No Disease"
-            
-        return {
-            "sensor_id": data.sensor_id,
-            "village": data.village,
-            "disease_prediction": {
-                "predicted_disease": disease,
-                "confidence": 0.75
-            }
-        }
+        cols = data.columns
+        lengths = {len(cols.sensor_id), len(cols.village), len(cols.temperature), len(cols.ph), len(cols.turbidity), len(cols.tds)}
+        if len(lengths) != 1:
+            raise HTTPException(status_code=400, detail="All columns must have the same length")
+        ids = list(zip(cols.sensor_id, cols.village))
+        features = {"temperature": cols.temperature, "ph": cols.ph, "turbidity": cols.turbidity, "tds": cols.tds}
+    if len(ids) > MAX_BATCH_PREDICT_ROWS:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_PREDICT_ROWS} rows)")
+
+    results = run_predictions(features)
+    predictions = [
+        {"sensor_id": sensor_id, "village": village, **result}
+        for (sensor_id, village), result in zip(ids, results)
+    ]
+    return {"count": len(predictions), "predictions": predictions}
 
 @app.post("/public/predict")
 def public_predict(data: PredictRequest):
     """Public prediction endpoint for testing without authentication"""
-    if ML_MODELS_AVAILABLE:
-        # Use advanced ML models
-        safety_result = predict_water_safety(data.temperature, data.ph, data.turbidity, data.tds)
-        disease_result = predict_disease(data.temperature, data.ph, data.turbidity, data.tds)
-        
-        return {
-            "sensor_id": data.sensor_id,
-            "village": data.village,
-            "water_safety": {
-                "is_safe": safety_result["is_safe"],
-                "confidence": safety_result["confidence"],
-                "risk_level": safety_result["risk_level"]
-            },
-            "disease_prediction": {
-                "predicted_disease": disease_result["predicted_disease"],
-                "confidence": disease_result["confidence"],
-                "top_predictions": disease_result["top_predictions"]
-            }
-        }
-    else:
-        # Fallback to simple rule-based prediction
-        unsafe = data.ph < 6.5 or data.ph > 8.5 or data.turbidity > 10 or data.tds > 500
-        result = "Unsafe" if unsafe else "Safe"
-        confidence = round(random.uniform(0.7, 0.95), 2)
-        return {"sensor_id": data.sensor_id, "village": data.village, "result": result, "confidence": confidence}
+    result = run_predictions([[data.temperature, data.ph, data.turbidity, data.tds]])[0]
+    return {"sensor_id": data.sensor_id, "village": data.village, **result}
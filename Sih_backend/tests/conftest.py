@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, BACKEND_DIR)
+
+# main connects to the database at import time; point it at a throwaway file
+os.environ.setdefault("TURSO_DATABASE_URL", os.path.join(tempfile.mkdtemp(), "test.db"))
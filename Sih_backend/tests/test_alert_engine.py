@@ -0,0 +1,136 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import main
+from main import AlertEngine, SensorReading
+
+def reading(sensor_id="SEN-ALERT-1", ph=7.2, turbidity=2.0):
+    return SensorReading(id=sensor_id, village="Pune", lat=18.5, lng=73.8, temperature=25.0, ph=ph,
+                         turbidity=turbidity, tds=250.0)
+
+def now():
+    return datetime.utcnow().isoformat()
+
+def stamp(*readings):
+    return [(r, now()) for r in readings]
+
+def test_failed_write_does_not_swallow_the_alert():
+    engine = AlertEngine(cooldown=3600, clear_readings=1)
+    with pytest.raises(RuntimeError):
+        with engine.observing(stamp(reading(ph=4.0))) as (alerts,):
+            assert len(alerts) == 1
+            raise RuntimeError("commit failed")
+    assert engine.stats()["open"] == 0
+    # Without the undo this reading would be suppressed by the cooldown
+    assert len(engine.observe(reading(ph=4.0), now())) == 1
+
+def test_failed_write_keeps_the_alert_open():
+    engine = AlertEngine(cooldown=3600, clear_readings=1)
+    engine.observe(reading(ph=4.0), now())
+    with pytest.raises(RuntimeError):
+        with engine.observing(stamp(reading())) as (alerts,):
+            assert alerts[0]["clearedAt"] is not None
+            raise RuntimeError("queue full")
+    assert engine.stats()["open"] == 1
+    assert engine.observe(reading(), now())[0]["clearedAt"] is not None
+
+def test_undo_leaves_later_readings_alone():
+    engine = AlertEngine(cooldown=3600, clear_readings=1)
+    with pytest.raises(RuntimeError):
+        with engine.observing(stamp(reading(turbidity=7.0))):
+            # Another request escalates and persists its alert meanwhile
+            escalated = engine.observe(reading(ph=4.0), now())
+            raise RuntimeError("commit failed")
+    assert engine.stats()["open"] == 1
+    assert engine.observe(reading(), now())[0]["id"] == escalated[-1]["id"]
+
+def test_undo_restores_a_batch_with_repeated_sensors():
+    engine = AlertEngine(cooldown=3600, clear_readings=1)
+    with pytest.raises(RuntimeError):
+        with engine.observing(stamp(reading(ph=4.0), reading(), reading(ph=4.0))):
+            raise RuntimeError("commit failed")
+    assert engine.stats()["open"] == 0
+
+def alerts_db(rows):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE sensor_data (id TEXT PRIMARY KEY)")
+    conn.execute("""CREATE TABLE alerts (id TEXT PRIMARY KEY, sensor_id TEXT, message TEXT, level TEXT,
+                    timestamp TEXT, acknowledged INTEGER, cleared_at TEXT)""")
+    conn.executemany("INSERT OR IGNORE INTO sensor_data (id) VALUES (?)", [(r[1],) for r in rows])
+    conn.executemany("INSERT INTO alerts VALUES (?, ?, 'msg', ?, ?, 0, ?)", rows)
+    return conn
+
+def test_load_only_resumes_the_newest_alert():
+    start = datetime.utcnow() - timedelta(hours=1)
+    at = lambda minutes: (start + timedelta(minutes=minutes)).isoformat()
+    conn = alerts_db([
+        # Written before cleared_at existed, then superseded
+        ("old-1", "SEN-A", "danger", at(0), None),
+        ("new-1", "SEN-A", "warning", at(10), None),
+        # Newest alert already cleared: nothing to resume
+        ("old-2", "SEN-B", "danger", at(0), None),
+        ("new-2", "SEN-B", "danger", at(10), at(20)),
+    ])
+    engine = AlertEngine(cooldown=3600, clear_readings=1)
+    engine.load(conn)
+    assert engine.stats()["open"] == 1
+    cleared = engine.observe(reading("SEN-A"), now())
+    assert [a["id"] for a in cleared] == ["new-1"]
+    assert engine.observe(reading("SEN-B"), now()) == []
+
+def test_route_reraises_after_a_failed_commit(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    sensor = {"id": "SEN-ALERT-ROUTE", "village": "Pune", "lat": 18.5, "lng": 73.8, "temperature": 25.0,
+              "ph": 4.0, "turbidity": 2.0, "tds": 250.0}
+    with TestClient(main.app) as client:
+        def failing_save(conn, alerts):
+            raise sqlite3.OperationalError("database is locked")
+        monkeypatch.setattr(main, "save_alerts", failing_save)
+        with pytest.raises(sqlite3.OperationalError):
+            client.post("/public/sensor_data", json=sensor)
+        monkeypatch.undo()
+        response = client.post("/public/sensor_data", json=sensor)
+        assert len(response.json()["alerts_generated"]) == 1
+
+def test_write_behind_reraises_after_a_dropped_batch(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    sensor = {"id": "SEN-ALERT-BEHIND", "village": "Pune", "lat": 18.5, "lng": 73.8, "temperature": 25.0,
+              "ph": 4.0, "turbidity": 2.0, "tds": 250.0}
+    buffer = main.IngestBuffer(max_size=10, flush_rows=10, flush_interval=0.05, enqueue_timeout=1, max_retries=1)
+    monkeypatch.setattr(main, "ingest_buffer", buffer)
+    with TestClient(main.app) as client:
+        def failing_write(conn, readings):
+            raise sqlite3.OperationalError("database is locked")
+        with monkeypatch.context() as patched:
+            patched.setattr(main, "write_readings", failing_write)
+            first = client.post("/public/sensor_data", json=sensor).json()
+            assert len(first["alerts_generated"]) == 1
+            buffer.stop()
+        assert buffer.stats()["dropped_rows"] == 1
+        buffer.start()
+        second = client.post("/public/sensor_data", json=sensor).json()
+        assert len(second["alerts_generated"]) == 1
+        buffer.stop()
+    assert buffer.stats()["flushed_rows"] == 1
+
+def test_write_behind_does_not_rewrite_committed_rows(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    sensor = {"id": "SEN-BEHIND-ONCE", "village": "Pune", "lat": 18.5, "lng": 73.8, "temperature": 25.0,
+              "ph": 7.0, "turbidity": 2.0, "tds": 250.0}
+    buffer = main.IngestBuffer(max_size=10, flush_rows=10, flush_interval=0.05, enqueue_timeout=1, max_retries=3)
+    monkeypatch.setattr(main, "ingest_buffer", buffer)
+    with TestClient(main.app) as client:
+        def failing_apply(readings):
+            raise RuntimeError("snapshot unavailable")
+        with monkeypatch.context() as patched:
+            patched.setattr(main.sensor_state, "apply", failing_apply)
+            client.post("/public/sensor_data", json=sensor)
+            buffer.stop()
+    with main.db_pool.connection() as conn:
+        count = conn.execute("SELECT COUNT(*) FROM sensor_history WHERE sensor_id = 'SEN-BEHIND-ONCE'").fetchone()[0]
+    assert count == 1
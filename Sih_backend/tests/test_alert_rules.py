@@ -0,0 +1,101 @@
+import json
+
+import numpy as np
+import pytest
+
+import alert_rules
+from alert_rules import DEFAULT_RULES, RuleSet
+
+def scalar_level(temperature, ph, turbidity, tds):
+    """The hard-coded checks the default rules replaced"""
+    if ph < 6.5 or ph > 8.5 or turbidity > 10 or tds > 500:
+        return "danger"
+    if 5 < turbidity <= 10 or 300 < tds <= 500:
+        return "warning"
+    return None
+
+def test_default_rules_match_the_old_thresholds():
+    rng = np.random.default_rng(0)
+    X = np.column_stack([rng.normal(25, 5, 5000), rng.normal(7.0, 1.0, 5000),
+                         rng.exponential(5, 5000), rng.normal(350, 150, 5000)])
+    # Readings exactly on every threshold
+    edges = [[25.0, ph, turbidity, tds] for ph in (6.5, 7.0, 8.5) for turbidity in (2.0, 5.0, 10.0)
+             for tds in (200.0, 300.0, 500.0)]
+    X = np.vstack([X, edges])
+    assert RuleSet(DEFAULT_RULES).levels(X) == [scalar_level(*row) for row in X.tolist()]
+
+def test_empty_inputs():
+    assert RuleSet([]).levels([[25.0, 4.0, 50.0, 900.0]]) == [None]
+    assert RuleSet(DEFAULT_RULES).evaluate(np.empty((0, 4))).shape == (0,)
+
+def test_village_rule_overrides_the_unscoped_one():
+    rules = RuleSet(DEFAULT_RULES + [
+        {"level": "danger", "metric": "turbidity", "op": ">", "value": 15, "village": "Pune"}
+    ])
+    X = [[25.0, 7.0, 12.0, 200.0]] * 2
+    # Pune's danger limit is 15, the warning rule above 5 still applies there
+    assert rules.levels(X, villages=["Pune", "Nashik"]) == ["warning", "danger"]
+    assert rules.levels([[25.0, 7.0, 16.0, 200.0]], villages=["Pune"]) == ["danger"]
+    # Without villages only unscoped rules are in force
+    assert rules.levels(X) == ["danger", "danger"]
+
+def test_most_specific_rule_wins():
+    rules = RuleSet([
+        {"level": "danger", "metric": "tds", "op": ">", "value": 500},
+        {"level": "danger", "metric": "tds", "op": ">", "value": 400, "sensor_type": "borewell"},
+        {"level": "danger", "metric": "tds", "op": ">", "value": 600, "village": "Pune"},
+        {"level": "danger", "metric": "tds", "op": ">", "value": 700, "village": "Pune", "sensor_type": "borewell"},
+    ])
+    X = [[25.0, 7.0, 2.0, 650.0]] * 4
+    villages = ["Pune", "Pune", "Nashik", "Nashik"]
+    types = ["borewell", "tap", "borewell", "tap"]
+    assert rules.levels(X, villages=villages, types=types) == [None, "danger", "danger", "danger"]
+    X = [[25.0, 7.0, 2.0, 450.0]] * 4
+    assert rules.levels(X, villages=villages, types=types) == [None, None, "danger", None]
+
+def test_overrides_stay_within_their_level_metric_and_direction():
+    rules = RuleSet(DEFAULT_RULES + [
+        {"level": "danger", "metric": "ph", "op": "<", "value": 6.0, "village": "Pune"}
+    ])
+    # The upper pH limit is a different direction and still applies in Pune
+    assert rules.levels([[25.0, 8.8, 2.0, 200.0], [25.0, 6.2, 2.0, 200.0]], villages=["Pune", "Pune"]) \
+        == ["danger", None]
+    # A turbidity override does not touch the tds rules
+    rules = RuleSet(DEFAULT_RULES + [
+        {"level": "warning", "metric": "turbidity", "op": ">", "value": 8, "village": "Pune"}
+    ])
+    assert rules.levels([[25.0, 7.0, 6.0, 350.0]], villages=["Pune"]) == ["warning"]
+
+def test_inclusive_operators():
+    rules = RuleSet([{"level": "warning", "metric": "ph", "op": "<=", "value": 6.5},
+                     {"level": "danger", "metric": "tds", "op": ">=", "value": 500}])
+    assert rules.levels([[25.0, 6.5, 2.0, 200.0], [25.0, 7.0, 2.0, 500.0], [25.0, 6.6, 2.0, 499.0]]) \
+        == ["warning", "danger", None]
+
+@pytest.mark.parametrize("rule", [
+    "ph > 8",
+    {"level": "critical", "metric": "ph", "op": ">", "value": 8},
+    {"level": "danger", "metric": "colour", "op": ">", "value": 8},
+    {"level": "danger", "metric": "ph", "op": "==", "value": 8},
+    {"level": "danger", "metric": "ph", "op": ">"},
+    {"level": "danger", "metric": "ph", "op": ">", "value": "high"},
+])
+def test_invalid_rules_are_rejected(rule):
+    with pytest.raises(ValueError):
+        RuleSet([rule])
+
+def test_rules_load_from_alert_rules_path(tmp_path, monkeypatch):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps([{"level": "warning", "metric": "temperature", "op": ">", "value": "30"}]))
+    monkeypatch.setattr(alert_rules, "ALERT_RULES_PATH", str(path))
+    rules = alert_rules.load_rules()
+    assert rules.rules == [{"level": "warning", "metric": "temperature", "op": ">", "value": 30.0}]
+    assert rules.levels([[31.0, 4.0, 2.0, 200.0]]) == ["warning"]
+
+    path.write_text(json.dumps([{"level": "warning", "metric": "temperature", "op": "~", "value": 30}]))
+    with pytest.raises(ValueError):
+        alert_rules.load_rules()
+
+def test_defaults_without_alert_rules_path(monkeypatch):
+    monkeypatch.setattr(alert_rules, "ALERT_RULES_PATH", None)
+    assert alert_rules.load_rules().rules == RuleSet(DEFAULT_RULES).rules
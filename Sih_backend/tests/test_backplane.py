@@ -0,0 +1,64 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+import websockets
+
+from local_server import running_server
+
+WORKERS = 2
+CLIENTS = 6
+READINGS = 20
+
+@pytest.fixture
+def server(tmp_path):
+    """uvicorn with several workers sharing a SQLite backplane"""
+    env = {
+        "TURSO_DATABASE_URL": str(tmp_path / "backplane-test.db"),
+        "BACKPLANE": "sqlite",
+        "BACKPLANE_PATH": str(tmp_path / "events.db"),
+        "PREDICT_ON_INGEST": "0",
+    }
+    with running_server(env, workers=WORKERS) as url:
+        yield url
+
+async def sensor_ids(ws, expected, timeout=15.0):
+    """Ids from the sensor updates a client receives, until it has all of `expected`"""
+    seen = set()
+    deadline = time.monotonic() + timeout
+    while seen < expected and time.monotonic() < deadline:
+        try:
+            message = json.loads(await asyncio.wait_for(ws.recv(), deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            break
+        if message["type"] == "sensor_update":
+            seen.add(message["sensor"]["id"])
+    return seen
+
+async def fan_out(url):
+    async with httpx.AsyncClient(base_url=url, timeout=60) as http:
+        await http.post("/signup", json={"username": "backplane-admin", "password": "backplane-password"})
+        login = await http.post("/login", data={"username": "backplane-admin", "password": "backplane-password"})
+        ws_url = url.replace("http", "ws", 1) + "/ws?token=" + login.json()["access_token"]
+        # The kernel spreads connections and posts over the workers, so clients
+        # and publishers end up on different processes
+        clients = [await websockets.connect(ws_url) for _ in range(CLIENTS)]
+        try:
+            expected = {f"SEN-BP-{k}" for k in range(READINGS)}
+            reading = {"village": "Pune", "lat": 18.5, "lng": 73.8, "temperature": 25.0, "ph": 7.2,
+                       "turbidity": 2.0, "tds": 250.0}
+            for sensor_id in sorted(expected):
+                response = await http.post("/public/sensor_data", json=dict(reading, id=sensor_id))
+                assert response.status_code == 200
+            received = await asyncio.gather(*(sensor_ids(ws, expected) for ws in clients))
+        finally:
+            for ws in clients:
+                await ws.close()
+    return expected, received
+
+def test_every_worker_delivers_every_event(server):
+    expected, received = asyncio.run(fan_out(server))
+    for seen in received:
+        assert seen == expected
@@ -0,0 +1,75 @@
+import asyncio
+
+from main import ALL_TOPIC, ConnectionManager
+
+class FakeWebSocket:
+    def __init__(self, send_delay=0.0):
+        self.send_delay = send_delay
+        self.sent = []
+        self.close_codes = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data):
+        await asyncio.sleep(self.send_delay)
+        self.sent.append(data)
+
+    async def close(self, code=1000):
+        self.close_codes.append(code)
+
+def run(scenario, **options):
+    async def main():
+        manager = ConnectionManager(**dict(dict(max_lag=4, slow_client_policy="resync", send_timeout=0.05,
+                                                coalesce_ms=0), **options))
+        await manager.start()
+        return await scenario(manager)
+    return asyncio.run(main())
+
+def test_disconnect_closes_normally():
+    async def scenario(manager):
+        ws = FakeWebSocket()
+        client = await manager.connect(ws, topics=(ALL_TOPIC,))
+        await asyncio.sleep(0)
+        manager.disconnect(ws)
+        await asyncio.gather(client.writer, return_exceptions=True)
+        assert client.writer.cancelled()
+        return ws, manager
+    ws, manager = run(scenario)
+    assert ws.close_codes == [1000]
+    assert manager.evictions == 0
+
+def test_shutdown_closes_with_going_away():
+    async def scenario(manager):
+        sockets = [FakeWebSocket(), FakeWebSocket()]
+        for ws in sockets:
+            await manager.connect(ws, topics=(ALL_TOPIC,))
+        await asyncio.sleep(0)
+        await manager.stop()
+        assert not manager.active
+        return sockets
+    for ws in run(scenario):
+        assert ws.close_codes == [1001]
+
+def test_slow_send_is_evicted_with_try_again_later():
+    async def scenario(manager):
+        ws = FakeWebSocket(send_delay=1.0)
+        client = await manager.connect(ws, topics=(ALL_TOPIC,))
+        manager.send(client, {"type": "ping"})
+        await asyncio.gather(client.writer, return_exceptions=True)
+        return ws, manager
+    ws, manager = run(scenario)
+    assert ws.close_codes == [1013]
+    assert manager.evictions == 1
+
+def test_falling_behind_with_drop_policy_is_evicted():
+    async def scenario(manager):
+        ws = FakeWebSocket(send_delay=0.01)
+        client = await manager.connect(ws, topics=(ALL_TOPIC,))
+        for _ in range(10):
+            manager.send(client, {"type": "ping"})
+        await asyncio.gather(client.writer, return_exceptions=True)
+        return ws, manager
+    ws, manager = run(scenario, slow_client_policy="drop")
+    assert ws.close_codes == [1013]
+    assert manager.evictions == 1
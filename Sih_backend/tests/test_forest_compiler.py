@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from forest_compiler import CompiledForest, check_parity, compile_forest
+
+def fit_forest(X, y, scaler=None):
+    scaler = scaler or StandardScaler().fit(X)
+    model = RandomForestClassifier(n_estimators=10, max_depth=6, random_state=0)
+    model.fit(scaler.transform(X), y)
+    return model, scaler
+
+def training_data(seed=0, n=400):
+    rng = np.random.default_rng(seed)
+    X = rng.integers(0, 20, (n, 4)).astype(float)
+    y = (X[:, 0] + X[:, 1] > 20).astype(int) + (X[:, 2] > 15)
+    return X, y
+
+def split_rows(model, scaler, rng):
+    """One row per split whose feature sits exactly on the split threshold (in raw units)"""
+    rows = []
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        for node in np.flatnonzero(tree.children_left != -1):
+            row = rng.uniform(0, 20, 4)
+            feature = tree.feature[node]
+            row[feature] = tree.threshold[node] * scaler.scale_[feature] + scaler.mean_[feature]
+            rows.append(row)
+    return np.array(rows)
+
+def test_matches_sklearn_on_random_rows():
+    X, y = training_data()
+    model, scaler = fit_forest(X, y)
+    compiled = compile_forest(model, scaler)
+    rows = np.random.default_rng(1).uniform(-5, 25, (500, 4))
+    np.testing.assert_allclose(compiled.predict_proba(rows), model.predict_proba(scaler.transform(rows)), rtol=0, atol=1e-12)
+    check_parity(compiled, model, scaler, rows)
+
+def test_matches_sklearn_on_split_thresholds():
+    X, y = training_data()
+    model, scaler = fit_forest(X, y)
+    compiled = compile_forest(model, scaler)
+    rows = split_rows(model, scaler, np.random.default_rng(2))
+    np.testing.assert_allclose(compiled.predict_proba(rows), model.predict_proba(scaler.transform(rows)), rtol=0, atol=1e-12)
+
+def test_matches_sklearn_when_rows_equal_thresholds_exactly():
+    # With an identity scaler the thresholds are x.5 midpoints that float32
+    # holds exactly, so these rows hit the `<=` boundary itself
+    X, y = training_data()
+    scaler = StandardScaler().fit(X)
+    scaler.mean_ = np.zeros(4)
+    scaler.scale_ = np.ones(4)
+    model, _ = fit_forest(X, y, scaler)
+    compiled = compile_forest(model, scaler)
+    rows = split_rows(model, scaler, np.random.default_rng(3))
+    assert any(row[model.estimators_[0].tree_.feature[0]] == model.estimators_[0].tree_.threshold[0] for row in rows)
+    np.testing.assert_allclose(compiled.predict_proba(rows), model.predict_proba(rows), rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(compiled.predict(rows), model.predict(rows))
+
+def test_save_and_load_round_trip(tmp_path):
+    X, y = training_data()
+    model, scaler = fit_forest(X, y)
+    compiled = compile_forest(model, scaler)
+    path = tmp_path / "forest.npz"
+    compiled.save(path)
+    loaded = CompiledForest.load(path)
+    np.testing.assert_array_equal(loaded.predict_proba(X), compiled.predict_proba(X))
+
+def test_check_parity_rejects_a_different_model():
+    X, y = training_data()
+    model, scaler = fit_forest(X, y)
+    other, _ = fit_forest(*training_data(seed=5), scaler=scaler)
+    with pytest.raises(ValueError):
+        check_parity(compile_forest(other, scaler), model, scaler, X)
@@ -0,0 +1,123 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+from main import ROLLUP_METRICS, ROLLUPS, SensorReading
+
+def reading(sensor_id, rng):
+    return SensorReading(id=sensor_id, village="Pune", lat=18.5, lng=73.8,
+                         temperature=round(rng.uniform(15, 35), 2), ph=round(rng.uniform(6, 9), 2),
+                         turbidity=round(rng.uniform(0, 12), 2), tds=round(rng.uniform(100, 600), 1))
+
+@pytest.fixture(scope="module")
+def conn():
+    with TestClient(main.app):
+        with main.db_pool.connection() as conn:
+            yield conn
+
+def rollup_rows(conn, sensor_ids):
+    marks = ", ".join("?" * len(sensor_ids))
+    return {
+        table: conn.execute(f"SELECT * FROM {table} WHERE sensor_id IN ({marks}) ORDER BY sensor_id, bucket",
+                            sensor_ids).fetchall()
+        for table, _, _, _ in ROLLUPS.values()
+    }
+
+def test_incremental_rollups_match_a_rebuild(conn):
+    rng = random.Random(7)
+    sensor_ids = ["SEN-ROLL-A", "SEN-ROLL-B"]
+    start = datetime(2026, 1, 1, 23, 30)
+    readings = [
+        (reading(rng.choice(sensor_ids), rng), (start + timedelta(seconds=rng.uniform(0, 2 * 86400))).isoformat())
+        for _ in range(400)
+    ]
+    # Batches of varying size, arriving out of time order
+    while readings:
+        size = rng.randint(1, 40)
+        main.write_readings(conn, readings[:size])
+        readings = readings[size:]
+    conn.commit()
+    incremental = rollup_rows(conn, sensor_ids)
+
+    main.rebuild_rollups(conn)
+    conn.commit()
+    rebuilt = rollup_rows(conn, sensor_ids)
+
+    for table in incremental:
+        assert len(incremental[table]) == len(rebuilt[table]) > 0
+        for ours, theirs in zip(incremental[table], rebuilt[table]):
+            assert ours[:3] == theirs[:3]
+            assert ours[3:] == pytest.approx(theirs[3:])
+
+def test_rollup_bucket_boundaries():
+    assert main.rollup_bucket("2026-01-01T10:59:59.999999", "minute") == "2026-01-01T10:59:00"
+    assert main.rollup_bucket("2026-01-01T10:59:59.999999", "hour") == "2026-01-01T10:00:00"
+    assert main.rollup_bucket("2026-01-01T23:59:59", "day") == "2026-01-01T00:00:00"
+    assert main.rollup_bucket("2026-01-02T00:00:00", "day") == "2026-01-02T00:00:00"
+
+@pytest.mark.parametrize("bucket, source", [
+    ("30s", "raw"), ("90s", "raw"), ("1m", "minute"), ("15m", "minute"), ("90m", "minute"),
+    ("1h", "hour"), ("6h", "hour"), ("25h", "hour"), ("1d", "day"), ("7d", "day"),
+])
+def test_bucket_source_is_the_coarsest_rollup_that_tiles_it(conn, bucket, source):
+    window = (datetime(2026, 3, 1), datetime(2026, 3, 2))
+    assert main.bucketed_history(conn, "SEN-NONE", bucket, *window, 20)["source"] == source
+
+def store_at(conn, sensor_id, stamped_tds):
+    rng = random.Random(0)
+    rows = []
+    for timestamp, tds in stamped_tds:
+        r = reading(sensor_id, rng)
+        rows.append((SensorReading(**dict(r.dict(), tds=tds)), timestamp))
+    main.write_readings(conn, rows)
+    conn.commit()
+
+def test_bucket_edges_from_rollups(conn):
+    store_at(conn, "SEN-EDGE-M", [
+        ("2026-02-01T10:00:00", 100.0), ("2026-02-01T10:14:59.999999", 200.0),
+        ("2026-02-01T10:15:00", 300.0), ("2026-02-01T10:29:59", 500.0),
+    ])
+    result = main.bucketed_history(conn, "SEN-EDGE-M", "15m", datetime(2026, 2, 1, 10), datetime(2026, 2, 1, 11), 20)
+    assert result["source"] == "minute"
+    assert result["timestamps"] == ["2026-02-01T10:00:00", "2026-02-01T10:15:00"]
+    assert result["samples"] == [2, 2]
+    assert result["tds"] == {"mean": [150.0, 400.0], "min": [100.0, 300.0], "max": [200.0, 500.0]}
+
+def test_bucket_edges_from_raw_history(conn):
+    store_at(conn, "SEN-EDGE-S", [
+        ("2026-02-01T10:00:00", 100.0), ("2026-02-01T10:00:29.999999", 200.0), ("2026-02-01T10:00:30", 300.0),
+    ])
+    result = main.bucketed_history(conn, "SEN-EDGE-S", "30s", datetime(2026, 2, 1, 10), datetime(2026, 2, 1, 11), 20)
+    assert result["source"] == "raw"
+    assert result["timestamps"] == ["2026-02-01T10:00:00", "2026-02-01T10:00:30"]
+    assert result["samples"] == [2, 1]
+
+def test_window_includes_the_partial_first_bucket(conn):
+    store_at(conn, "SEN-EDGE-H", [("2026-02-01T10:05:00", 100.0), ("2026-02-01T11:05:00", 300.0)])
+    # The window starts mid-hour; the hour rollup for 10:00 still counts
+    result = main.bucketed_history(conn, "SEN-EDGE-H", "1h", datetime(2026, 2, 1, 10, 30), datetime(2026, 2, 1, 12), 20)
+    assert result["timestamps"] == ["2026-02-01T10:00:00", "2026-02-01T11:00:00"]
+
+@pytest.mark.parametrize("bucket", ["0m", "15", "m", "1w", "-5m"])
+def test_invalid_buckets_are_rejected(conn, bucket):
+    with pytest.raises(HTTPException) as error:
+        main.bucketed_history(conn, "SEN-NONE", bucket, None, None, 20)
+    assert error.value.status_code == 422
+
+def test_too_many_buckets_are_rejected(conn):
+    with pytest.raises(HTTPException):
+        main.bucketed_history(conn, "SEN-NONE", "1s", datetime(2026, 1, 1), datetime(2026, 1, 2), 20)
+
+@pytest.mark.parametrize("span, resolution", [
+    (timedelta(minutes=30), "raw"), (timedelta(days=1), "minute"), (timedelta(days=60), "hour"),
+    (timedelta(days=3650), "day"),
+])
+def test_auto_resolution(span, resolution, monkeypatch):
+    monkeypatch.setattr(main, "HISTORY_AUTO_POINTS", 200)
+    end = datetime(2026, 1, 1)
+    assert main.pick_resolution(end - span, end) == resolution
+    assert main.pick_resolution(None, end) == "raw"
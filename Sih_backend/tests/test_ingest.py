@@ -0,0 +1,20 @@
+from fastapi.testclient import TestClient
+
+import main
+
+def test_batch_readings_of_one_sensor_get_distinct_timestamps():
+    readings = [
+        {"id": "SEN-BATCH-1", "village": "Pune", "lat": 18.5, "lng": 73.8, "temperature": 25.0, "ph": 7.0,
+         "turbidity": 2.0, "tds": tds}
+        for tds in (200.0, 210.0, 220.0)
+    ]
+    with TestClient(main.app) as client:
+        response = client.post("/public/sensor_data/batch", json=readings)
+        assert response.json()["accepted"] == 3
+    with main.db_pool.connection() as conn:
+        rows = conn.execute(
+            "SELECT created_at, tds FROM sensor_history WHERE sensor_id = 'SEN-BATCH-1' ORDER BY created_at"
+        ).fetchall()
+    # Predictions are keyed on (sensor_id, reading_at), so equal stamps would collapse them
+    assert len({created_at for created_at, _ in rows}) == 3
+    assert [tds for _, tds in rows] == [200.0, 210.0, 220.0]
@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+READING = {"village": "Pune", "lat": 18.5, "lng": 73.8, "temperature": 25.0, "ph": 7.2, "turbidity": 2.0, "tds": 250.0}
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as client:
+        client.post("/signup", json={"username": "events-admin", "password": "events-password"})
+        token = client.post("/login", data={"username": "events-admin", "password": "events-password"}).json()["access_token"]
+        client.token = token
+        client.headers.update({"Authorization": f"Bearer {token}"})
+        yield client
+
+def receive(ws, timeout=5.0):
+    """ws.receive_json() that fails the test instead of hanging"""
+    result = []
+    reader = threading.Thread(target=lambda: result.append(ws.receive_json()), daemon=True)
+    reader.start()
+    reader.join(timeout)
+    assert result, "no websocket frame within timeout"
+    return result[0]
+
+def receive_event(ws, event_type):
+    for _ in range(20):
+        message = receive(ws)
+        if message["type"] == event_type:
+            return message
+    raise AssertionError(f"no {event_type} frame received")
+
+@pytest.mark.parametrize("path, authenticated", [("/sensor_data", True), ("/public/sensor_data", False)])
+def test_sensor_posts_reach_websocket_clients(client, path, authenticated):
+    sensor_id = f"SEN-EVENTS-{path.strip('/').replace('/', '-')}"
+    with client.websocket_connect(f"/ws?token={client.token}") as ws:
+        headers = None if authenticated else {"Authorization": ""}
+        response = client.post(path, json=dict(READING, id=sensor_id), headers=headers)
+        assert response.status_code == 200
+        message = receive_event(ws, "sensor_update")
+        assert message["sensor"]["id"] == sensor_id
+
+def test_health_reports_reach_websocket_clients(client):
+    with client.websocket_connect(f"/ws?token={client.token}") as ws:
+        report = {"id": "REP-EVENTS-1", "village": "Pune", "symptoms": ["fever"], "phone": None}
+        assert client.post("/health_reports", json=report).status_code == 200
+        message = receive_event(ws, "health_report")
+        assert message["report"]["id"] == "REP-EVENTS-1"
+
+def test_every_client_gets_the_event(client):
+    with client.websocket_connect(f"/ws?token={client.token}") as first, \
+            client.websocket_connect(f"/ws?token={client.token}") as second:
+        assert client.post("/public/sensor_data", json=dict(READING, id="SEN-EVENTS-FANOUT")).status_code == 200
+        for ws in (first, second):
+            assert receive_event(ws, "sensor_update")["sensor"]["id"] == "SEN-EVENTS-FANOUT"
+
+def test_alerts_route_on_the_reading_village(client):
+    with client.websocket_connect(f"/ws?token={client.token}") as ws:
+        ws.send_json({"action": "subscribe", "villages": ["Alertville"], "types": ["alert"]})
+        assert receive(ws)["type"] == "subscribed"
+        reading = dict(READING, id="SEN-EVENTS-ALERT", village="Alertville", ph=4.0)
+        assert client.post("/public/sensor_data", json=reading).status_code == 200
+        message = receive_event(ws, "alert")
+        assert message["village"] == "Alertville"
+        assert message["alert"]["sensorId"] == "SEN-EVENTS-ALERT"
+
+def test_alert_topics_do_not_need_the_snapshot():
+    message = {"type": "alert", "alert": {"sensorId": "SEN-NOT-IN-SNAPSHOT"}, "village": "Elsewhere"}
+    assert ("village", "Elsewhere") in main.ConnectionManager._topics_of(message)
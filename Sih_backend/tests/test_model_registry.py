@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+import water_safety_model
+
+from water_safety_model import CURRENT_POINTER, ModelRegistry, publish_version, resolve_model_dir, train_models
+
+def train(output_dir):
+    return train_models(output_dir=str(output_dir), safety_samples=200, disease_samples=200, n_estimators=3,
+                        max_depth=4, safety_jobs=1, disease_jobs=1, parallel=False)['version']
+
+def test_publish_swaps_the_whole_set(tmp_path):
+    first = train(tmp_path)
+    registry = ModelRegistry(str(tmp_path), reload_interval=0)
+    assert resolve_model_dir(str(tmp_path)) == os.path.join(str(tmp_path), "versions", first)
+    first_snapshot = registry.get()
+    # Nothing is copied into the live directory, only the pointer changes
+    assert sorted(os.listdir(tmp_path)) == [CURRENT_POINTER, "versions"]
+
+    second = train(tmp_path)
+    second_snapshot = registry.get()
+    assert second_snapshot.version != first_snapshot.version
+
+    # Roll back to the first set
+    publish_version(str(tmp_path), first)
+    assert registry.get().version == first_snapshot.version
+    assert registry.get().safety_model is not second_snapshot.safety_model
+
+def test_publish_rejects_an_incomplete_version(tmp_path):
+    version = train(tmp_path)
+    os.remove(os.path.join(tmp_path, "versions", version, "disease_scaler.pkl"))
+    with pytest.raises(FileNotFoundError):
+        publish_version(str(tmp_path), version)
+
+def test_reads_flat_directories_without_a_pointer(tmp_path):
+    version = train(tmp_path)
+    os.remove(os.path.join(tmp_path, CURRENT_POINTER))
+    assert resolve_model_dir(str(tmp_path)) == str(tmp_path)
+    flat = ModelRegistry(os.path.join(str(tmp_path), "versions", version), reload_interval=0)
+    assert flat.get().version
+
+def test_parity_is_checked_on_a_bounded_sample(tmp_path, monkeypatch):
+    monkeypatch.setattr(water_safety_model, "PARITY_CHECK_ROWS", 50)
+    report = train_models(str(tmp_path), safety_samples=400, disease_samples=200, n_estimators=3, max_depth=4,
+                          safety_jobs=1, disease_jobs=1, parallel=False)
+    assert report['models']['water_safety']['parity_rows'] == 50
+    assert report['models']['disease']['parity_rows'] == 40
+    assert 'total_seconds' not in report
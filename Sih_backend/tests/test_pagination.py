@@ -0,0 +1,86 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+ROWS = 12
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as client:
+        client.post("/signup", json={"username": "paging-admin", "password": "paging-password"})
+        token = client.post("/login", data={"username": "paging-admin", "password": "paging-password"}).json()["access_token"]
+        client.headers.update({"Authorization": f"Bearer {token}"})
+        with main.db_pool.connection() as conn:
+            conn.execute("DELETE FROM alerts")
+            # Pairs of alerts share a timestamp, so pages must break ties on id
+            conn.executemany(
+                "INSERT INTO alerts (id, sensor_id, message, level, timestamp, acknowledged) VALUES (?, 'SEN-PAGE', 'msg', 'warning', ?, 0)",
+                [(f"ALERT-{k:02d}", f"2026-01-01T00:00:{k // 2:02d}") for k in range(ROWS)]
+            )
+            conn.commit()
+        yield client
+
+def test_listing_without_limit_or_cursor_is_complete(client, monkeypatch):
+    monkeypatch.setattr(main, "PAGE_SIZE_DEFAULT", 5)
+    body = client.get("/alerts").json()
+    assert len(body["alerts"]) == ROWS
+    assert body["next_cursor"] is None
+
+def all_pages(client, path, limit):
+    ids, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        body = client.get(path, params=params).json()
+        ids += [a["id"] for a in body["alerts"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return ids
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 5, ROWS, ROWS + 1])
+def test_pages_cover_every_row_once_across_timestamp_ties(client, limit):
+    expected = sorted((f"ALERT-{k:02d}" for k in range(ROWS)), reverse=True)
+    assert all_pages(client, "/alerts", limit) == expected
+
+def test_cursor_round_trip():
+    cursor = main.encode_cursor("2026-01-01T00:00:05", "ALERT-11")
+    assert main.decode_cursor(cursor) == ("2026-01-01T00:00:05", "ALERT-11")
+
+@pytest.mark.parametrize("cursor", ["not-base64!", main.encode_cursor("only", "two")[:-4], "WzFd"])
+def test_invalid_cursor_is_rejected(client, cursor):
+    assert client.get("/alerts", params={"cursor": cursor}).status_code == 422
+
+def test_ndjson_streams_every_row_in_chunks(client, monkeypatch):
+    monkeypatch.setattr(main, "EXPORT_CHUNK_ROWS", 5)
+    response = client.get("/alerts", params={"format": "ndjson"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = response.text.splitlines()
+    assert [json.loads(line)["id"] for line in lines] == sorted((f"ALERT-{k:02d}" for k in range(ROWS)), reverse=True)
+
+def test_ndjson_resumes_after_a_cursor(client):
+    cursor = client.get("/alerts", params={"limit": 4}).json()["next_cursor"]
+    lines = client.get("/alerts", params={"format": "ndjson", "cursor": cursor}).text.splitlines()
+    assert len(lines) == ROWS - 4
+
+def test_ndjson_export_holds_one_pool_connection(client, monkeypatch):
+    monkeypatch.setattr(main, "EXPORT_CHUNK_ROWS", 2)
+    acquire, release = main.db_pool.acquire, main.db_pool.release
+    held = {"now": 0, "peak": 0}
+
+    def counting_acquire(*args, **kwargs):
+        conn = acquire(*args, **kwargs)
+        held["now"] += 1
+        held["peak"] = max(held["peak"], held["now"])
+        return conn
+
+    def counting_release(*args, **kwargs):
+        held["now"] -= 1
+        return release(*args, **kwargs)
+    monkeypatch.setattr(main.db_pool, "acquire", counting_acquire)
+    monkeypatch.setattr(main.db_pool, "release", counting_release)
+    # A fresh login misses the principal cache, so auth checks out the request connection too
+    main.principal_cache.invalidate("paging-admin")
+    assert len(client.get("/alerts", params={"format": "ndjson"}).text.splitlines()) == ROWS
+    assert held["peak"] == 1
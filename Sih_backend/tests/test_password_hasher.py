@@ -0,0 +1,34 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from main import PasswordHasher
+
+def test_cancelled_login_keeps_its_slot_until_the_hash_finishes():
+    hasher = PasswordHasher(workers=1, max_pending=1)
+    release = threading.Event()
+
+    async def scenario():
+        waiting = asyncio.create_task(hasher._run(release.wait))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        # The client is gone but bcrypt is still busy: no room for another login
+        with pytest.raises(HTTPException) as rejected:
+            await hasher._run(lambda: None)
+        assert rejected.value.status_code == 429
+        assert hasher.stats()["pending"] == 1
+
+        release.set()
+        for _ in range(100):
+            if hasher.stats()["pending"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert await hasher._run(lambda: "hashed") == "hashed"
+
+    asyncio.run(scenario())
+    assert hasher.stats()["pending"] == 0
+    assert hasher.stats()["rejected"] == 1
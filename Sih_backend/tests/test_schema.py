@@ -0,0 +1,34 @@
+import re
+
+import pytest
+
+import main
+
+# Query shapes the API runs, and the index each one should use
+QUERIES = [
+    ("SELECT id FROM alerts WHERE (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT 5",
+     ("a", "b"), "idx_alerts_timestamp_id"),
+    ("SELECT id FROM alerts WHERE sensor_id = ? ORDER BY timestamp DESC, rowid DESC LIMIT 1",
+     ("s",), "idx_alerts_sensor_timestamp"),
+    ("SELECT id FROM health_reports WHERE village = ? ORDER BY created_at DESC, id DESC LIMIT 5",
+     ("x",), "idx_health_reports_village_created_id"),
+    ("SELECT id FROM health_reports WHERE created_at >= ? ORDER BY created_at DESC, id DESC LIMIT 5",
+     ("a",), "idx_health_reports_created_id"),
+    ("SELECT ph FROM sensor_history WHERE sensor_id = ? AND created_at >= ? ORDER BY created_at",
+     ("s", "a"), "idx_sensor_history_sensor_created"),
+]
+
+@pytest.fixture(scope="module")
+def conn():
+    main.init_database()
+    with main.db_pool.connection() as conn:
+        yield conn
+
+@pytest.mark.parametrize("query, params, index", QUERIES)
+def test_queries_use_their_index(conn, query, params, index):
+    plan = " ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall())
+    assert index in plan
+
+def test_every_index_is_used():
+    created = {re.search(r"INDEX IF NOT EXISTS (\w+)", statement).group(1) for statement in main.INDEXES}
+    assert created == {index for _, _, index in QUERIES}
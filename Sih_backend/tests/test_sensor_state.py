@@ -0,0 +1,100 @@
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from main import SensorReading, SensorStateCache
+
+def reading(sensor_id, tds=250.0):
+    return SensorReading(id=sensor_id, village="Pune", lat=18.5, lng=73.8, temperature=25.0, ph=7.0,
+                         turbidity=2.0, tds=tds)
+
+def prediction(reading_at):
+    return main.prediction_from_row([reading_at, 1, 0.9, "low", "none", 0.8, "test"])
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+def store(sensor, timestamp):
+    with main.db_pool.connection() as conn:
+        main.write_readings(conn, [(sensor, timestamp)])
+        conn.commit()
+
+def race(monkeypatch, during):
+    """Run `during` after the reload's query, before the snapshot is swapped in"""
+    connection = main.db_connection
+
+    class Racing:
+        def __init__(self, conn):
+            self._conn = conn
+
+        def execute(self, *args):
+            cursor = self._conn.execute(*args)
+            during()
+            return cursor
+
+    @contextmanager
+    def racing_connection():
+        with connection() as conn:
+            yield Racing(conn)
+    monkeypatch.setattr(main, "db_connection", racing_connection)
+
+def test_update_during_first_load_is_kept(client, monkeypatch):
+    store(reading("SEN-RACE-1", tds=100.0), "2020-01-01T00:00:00")
+    cache = SensorStateCache(refresh_interval=60)
+    race(monkeypatch, lambda: cache.apply([(reading("SEN-RACE-1", tds=200.0), "2030-01-01T00:00:00")]))
+    _, sensors = cache.get()
+    sensor = next(s for s in sensors if s["id"] == "SEN-RACE-1")
+    assert sensor["readings"]["tds"] == 200.0
+
+def test_update_during_reload_is_kept(client, monkeypatch):
+    store(reading("SEN-RACE-2", tds=100.0), "2020-01-01T00:00:00")
+    cache = SensorStateCache(refresh_interval=0)
+    cache.get()
+    race(monkeypatch, lambda: cache.apply([(reading("SEN-RACE-2", tds=300.0), "2030-01-01T00:00:00")]))
+    cache.get()
+    monkeypatch.undo()
+    with cache._lock:
+        assert cache._sensors["SEN-RACE-2"]["readings"]["tds"] == 300.0
+
+def test_prediction_during_reload_is_kept(client, monkeypatch):
+    store(reading("SEN-RACE-3"), "2020-01-01T00:00:00")
+    cache = SensorStateCache(refresh_interval=0)
+    cache.get()
+    race(monkeypatch, lambda: cache.apply_predictions([("SEN-RACE-3", prediction("2030-01-01T00:00:00"))]))
+    cache.get()
+    monkeypatch.undo()
+    with cache._lock:
+        assert cache._sensors["SEN-RACE-3"]["prediction"]["reading_at"] == "2030-01-01T00:00:00"
+
+def test_reload_keeps_newer_database_rows(client, monkeypatch):
+    store(reading("SEN-RACE-4", tds=400.0), "2030-01-01T00:00:00")
+    cache = SensorStateCache(refresh_interval=0)
+    race(monkeypatch, lambda: cache.apply([(reading("SEN-RACE-4", tds=100.0), "2020-01-01T00:00:00")]))
+    cache.get()
+    monkeypatch.undo()
+    with cache._lock:
+        assert cache._sensors["SEN-RACE-4"]["readings"]["tds"] == 400.0
+
+@pytest.mark.parametrize("header, matches", [
+    ('"abc-1"', True),
+    ('W/"abc-1"', True),
+    ('"zzz", W/"abc-1"', True),
+    ("*", True),
+    ('"abc-2"', False),
+    ('"abc-10"', False),
+    (None, False),
+])
+def test_etag_matches(header, matches):
+    assert main.etag_matches(header, '"abc-1"') is matches
+
+def test_sensors_answers_304_to_a_weak_validator(client):
+    client.post("/signup", json={"username": "etag-admin", "password": "etag-password"})
+    token = client.post("/login", data={"username": "etag-admin", "password": "etag-password"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    etag = client.get("/sensors", headers=headers).headers["etag"]
+    response = client.get("/sensors", headers=dict(headers, **{"If-None-Match": f'"other", W/{etag}'}))
+    assert response.status_code == 304
@@ -1,134 +1,208 @@
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
 import joblib
 import random
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from forest_compiler import CompiledForest, compile_forest, check_parity
+from alert_rules import LEVELS, rules as alert_rules
 
-def generate_water_safety_data():
+# Directory the trained artifacts are written to and loaded from
+MODEL_DIR = os.environ.get("MODEL_DIR", ".")
+# Minimum seconds between checks of the artifacts on disk for changes
+MODEL_RELOAD_INTERVAL = float(os.environ.get("MODEL_RELOAD_INTERVAL", "2.0"))
+
+MODEL_ARTIFACTS = {
+    'safety_model': 'water_safety_model.pkl',
+    'safety_scaler': 'water_safety_scaler.pkl',
+    'disease_model': 'disease_model.pkl',
+    'disease_scaler': 'disease_scaler.pkl',
+    'disease_labels': 'disease_labels.pkl',
+}
+
+# Flat-array exports of the forests: name -> (file, model key, scaler key)
+COMPILED_ARTIFACTS = {
+    'safety_compiled': ('water_safety_compiled.npz', 'safety_model', 'safety_scaler'),
+    'disease_compiled': ('disease_compiled.npz', 'disease_model', 'disease_scaler'),
+}
+# File in MODEL_DIR naming the versions/<version> directory that is served.
+# It is replaced with one rename, so a publish or rollback switches every
+# artifact at once; without it the artifacts are read from MODEL_DIR itself
+CURRENT_POINTER = "CURRENT"
+# Test rows the compiled forest is checked against after training. The
+# evaluator allocates (rows x trees) index arrays, so the check uses a seeded
+# sample rather than the whole split
+PARITY_CHECK_ROWS = 10_000
+
+# Past this many rows sklearn's multithreaded traversal beats the NumPy evaluator
+COMPILED_MAX_ROWS = int(os.environ.get("COMPILED_MAX_ROWS", "512"))
+# Predictions cached per distinct quantized reading (0 disables the cache)
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", "4096"))
+
+DISEASES = [
+    "No Disease",
+    "Gastroenteritis", 
+    "Cholera",
+    "Typhoid",
+    "Hepatitis A",
+    "Dysentery",
+    "Skin Infection"
+]
+
+# Rows per chunk when the caller doesn't ask for a size
+DEFAULT_CHUNK_SIZE = 100_000
+
+def _base_parameters(rng, n):
+    """Draw n raw temperature, ph, turbidity and tds values"""
+    temperature = rng.normal(25, 5, n)  # 20-30°C range
+    ph = rng.normal(7.0, 0.8, n)  # 6.2-7.8 range
+    turbidity = rng.exponential(2, n)  # 0-20 NTU
+    tds = rng.normal(300, 100, n)  # 100-500 ppm
+    return temperature, ph, turbidity, tds
+
+def _water_safety_chunk(rng, n):
+    temperature, ph, turbidity, tds = _base_parameters(rng, n)
+
+    # Determine safety based on WHO guidelines
+    ph_unsafe = (ph < 6.5) | (ph > 8.5)  # 6.5-8.5 is safe
+    turbidity_unsafe = turbidity > 10  # < 5 NTU is safe
+    tds_unsafe = tds > 1000  # < 500 ppm is safe
+    temperature_unsafe = (temperature < 10) | (temperature > 35)  # 15-30°C is safe
+    is_unsafe = ph_unsafe | turbidity_unsafe | tds_unsafe | temperature_unsafe
+
+    safety_score = (
+        np.where(ph_unsafe, 2, np.where((ph < 6.8) | (ph > 8.2), 1, 0))
+        + np.where(turbidity_unsafe, 2, np.where(turbidity > 5, 1, 0))
+        + np.where(tds_unsafe, 2, np.where(tds > 500, 1, 0))
+        + temperature_unsafe
+    )
+
+    # Add some noise to make it more realistic, then keep realistic bounds
+    temperature = np.clip(temperature + rng.normal(0, 0.5, n), 5, 40)
+    ph = np.clip(ph + rng.normal(0, 0.1, n), 4, 10)
+    turbidity = np.clip(turbidity + rng.normal(0, 0.2, n), 0, 50)
+    tds = np.clip(tds + rng.normal(0, 10, n), 50, 2000)
+
+    return np.column_stack([temperature, ph, turbidity, tds, is_unsafe, safety_score]).astype(float)
+
+def _disease_chunk(rng, n):
+    temperature, ph, turbidity, tds = _base_parameters(rng, n)
+
+    # Determine disease based on water quality; the first matching rule wins
+    disease_idx = np.select(
+        [
+            (turbidity > 8) & (ph < 6.5),          # Gastroenteritis
+            (turbidity > 15) & (temperature > 30),  # Cholera
+            (tds > 800) & (temperature > 28),       # Typhoid
+            (ph < 6.0) & (temperature > 32),        # Hepatitis A
+            (turbidity > 10) & (tds > 600),         # Dysentery
+            (ph < 5.5) | (ph > 9.0),                # Skin Infection
+        ],
+        [1, 2, 3, 4, 5, 6],
+        default=0,  # No Disease
+    )
+
+    # Add some randomness: 10% chance of a random disease
+    noisy = rng.random(n) < 0.1
+    disease_idx[noisy] = rng.integers(1, len(DISEASES), noisy.sum())
+
+    return np.column_stack([temperature, ph, turbidity, tds, disease_idx]).astype(float)
+
+def _iter_chunks(make_chunk, n_samples, chunk_size, seed):
+    rng = np.random.default_rng(seed)
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    for start in range(0, n_samples, chunk_size):
+        yield make_chunk(rng, min(chunk_size, n_samples - start))
+
+def iter_water_safety_data(n_samples, chunk_size=None, seed=42):
+    """Yield synthetic water safety rows in chunks of at most `chunk_size`.
+
+    Columns are temperature, ph, turbidity, tds, is_unsafe, safety_score.
+    Only one chunk is alive at a time, so memory stays bounded however
+    large `n_samples` is. The same (seed, chunk_size) gives the same rows.
+    """
+    return _iter_chunks(_water_safety_chunk, n_samples, chunk_size, seed)
+
+def iter_disease_data(n_samples, chunk_size=None, seed=123):
+    """Yield synthetic disease rows (temperature, ph, turbidity, tds, disease index) in chunks"""
+    return _iter_chunks(_disease_chunk, n_samples, chunk_size, seed)
+
+def generate_water_safety_data(n_samples=1000, seed=42):
     """Generate synthetic water quality data for training"""
-    np.random.seed(42)
-    n_samples = 1000
-    
-    # Generate realistic water quality parameters
-    data = []
-    
-    for i in range(n_samples):
-        # Generate base parameters
-        temperature = np.random.normal(25, 5)  # 20-30°C range
-        ph = np.random.normal(7.0, 0.8)  # 6.2-7.8 range
-        turbidity = np.random.exponential(2)  # 0-20 NTU
-        tds = np.random.normal(300, 100)  # 100-500 ppm
-        
-        # Determine safety based on WHO guidelines
-        is_safe = True
-        safety_score = 0
-        
-        # pH safety (6.5-8.5 is safe)
-        if ph < 6.5 or ph > 8.5:
-            is_safe = False
-            safety_score += 2
-        elif ph < 6.8 or ph > 8.2:
-            safety_score += 1
-            
-        # Turbidity safety (< 5 NTU is safe)
-        if turbidity > 10:
-            is_safe = False
-            safety_score += 2
-        elif turbidity > 5:
-            safety_score += 1
-            
-        # TDS safety (< 500 ppm is safe)
-        if tds > 1000:
-            is_safe = False
-            safety_score += 2
-        elif tds > 500:
-            safety_score += 1
-            
-        # Temperature safety (15-30°C is safe)
-        if temperature < 10 or temperature > 35:
-            is_safe = False
-            safety_score += 1
-            
-        # Add some noise to make it more realistic
-        temperature += np.random.normal(0, 0.5)
-        ph += np.random.normal(0, 0.1)
-        turbidity += np.random.normal(0, 0.2)
-        tds += np.random.normal(0, 10)
-        
-        # Ensure realistic bounds
-        temperature = max(5, min(40, temperature))
-        ph = max(4, min(10, ph))
-        turbidity = max(0, min(50, turbidity))
-        tds = max(50, min(2000, tds))
-        
-        data.append([temperature, ph, turbidity, tds, int(not is_safe), safety_score])
-    
-    return np.array(data)
+    chunks = list(iter_water_safety_data(n_samples, seed=seed))
+    return np.concatenate(chunks) if chunks else np.empty((0, 6))
 
-def generate_disease_data():
+def generate_disease_data(n_samples=800, seed=123):
     """Generate synthetic disease prediction data based on water quality"""
-    np.random.seed(123)
-    n_samples = 800
-    
-    diseases = [
-        "No Disease",
-        "Gastroenteritis", 
-        "Cholera",
-        "Typhoid",
-        "Hepatitis A",
-        "Dysentery",
-        "Skin Infection"
-    ]
-    
-    data = []
-    
-    for i in range(n_samples):
-        # Generate water quality parameters
-        temperature = np.random.normal(25, 5)
-        ph = np.random.normal(7.0, 0.8)
-        turbidity = np.random.exponential(2)
-        tds = np.random.normal(300, 100)
-        
-        # Determine disease based on water quality
-        disease_idx = 0  # No Disease by default
-        
-        # High turbidity and low pH -> Gastroenteritis
-        if turbidity > 8 and ph < 6.5:
-            disease_idx = 1
-        # Very high turbidity and high temperature -> Cholera
-        elif turbidity > 15 and temperature > 30:
-            disease_idx = 2
-        # High TDS and high temperature -> Typhoid
-        elif tds > 800 and temperature > 28:
-            disease_idx = 3
-        # Low pH and high temperature -> Hepatitis A
-        elif ph < 6.0 and temperature > 32:
-            disease_idx = 4
-        # High turbidity and high TDS -> Dysentery
-        elif turbidity > 10 and tds > 600:
-            disease_idx = 5
-        # Extreme pH -> Skin Infection
-        elif ph < 5.5 or ph > 9.0:
-            disease_idx = 6
-            
-        # Add some randomness
-        if np.random.random() < 0.1:  # 10% chance of random disease
-            disease_idx = np.random.randint(1, len(diseases))
-            
-        data.append([temperature, ph, turbidity, tds, disease_idx])
-    
-    return np.array(data), diseases
+    chunks = list(iter_disease_data(n_samples, seed=seed))
+    return (np.concatenate(chunks) if chunks else np.empty((0, 5))), list(DISEASES)
+
+def _write_artifact(write, directory, filename):
+    """Write one artifact through a temp file and rename it into place.
+
+    os.replace is atomic, so the model registry never sees a half-written file.
+    """
+    path = os.path.join(directory, filename)
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+def _save_artifacts(output_dir, pickles, compiled, report):
+    """Save pickles first and compiled exports last, recording sizes in report"""
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    sizes = {}
+    for filename, obj in pickles.items():
+        path = _write_artifact(lambda tmp, obj=obj: joblib.dump(obj, tmp), output_dir, filename)
+        sizes[filename] = os.path.getsize(path)
+    # The registry only trusts an export that is at least as new as its pickle
+    for filename, forest in compiled.items():
+        path = _write_artifact(forest.save, output_dir, filename)
+        sizes[filename] = os.path.getsize(path)
+    report['save_seconds'] = time.perf_counter() - start
+    report['artifacts'] = sizes
+    report['size_bytes'] = sum(sizes.values())
+
+def resolve_model_dir(model_dir=MODEL_DIR):
+    """Directory the live artifacts are read from"""
+    try:
+        with open(os.path.join(model_dir, CURRENT_POINTER)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return model_dir
+    return os.path.join(model_dir, "versions", version)
+
+def publish_version(output_dir, version):
+    """Serve the artifacts in <output_dir>/versions/<version>; also how to roll back"""
+    version_dir = os.path.join(output_dir, "versions", version)
+    missing = [f for f in MODEL_ARTIFACTS.values() if not os.path.exists(os.path.join(version_dir, f))]
+    if missing:
+        raise FileNotFoundError(f"Model version {version} is missing {', '.join(missing)}")
+    def write_pointer(tmp):
+        with open(tmp, 'w') as f:
+            f.write(version + "\n")
+    _write_artifact(write_pointer, output_dir, CURRENT_POINTER)
+
+def _fit_forest(name, X, y, n_estimators, max_depth, n_jobs, report):
+    """Split, scale, fit and evaluate one forest and compile it for serving"""
+    # Imported here so serving still works (on the rule-based fallback)
+    # when sklearn isn't installed
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
 
-def train_water_safety_model():
-    """Train water safety prediction model"""
-    print("Generating water safety training data...")
-    data = generate_water_safety_data()
-    
-    X = data[:, :-2]  # Features: temperature, ph, turbidity, tds
-    y = data[:, -2]   # Target: is_unsafe (0 or 1)
-    
     # Split data
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
@@ -138,164 +212,593 @@ def train_water_safety_model():
     X_test_scaled = scaler.transform(X_test)
     
     # Train model
-    model = RandomForestClassifier(n_estimators=100, random_state=42)
+    start = time.perf_counter()
+    model = RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth, n_jobs=n_jobs, random_state=42)
     model.fit(X_train_scaled, y_train)
+    report['fit_seconds'] = time.perf_counter() - start
     
     # Evaluate
+    start = time.perf_counter()
     train_score = model.score(X_train_scaled, y_train)
     test_score = model.score(X_test_scaled, y_test)
+    report['evaluate_seconds'] = time.perf_counter() - start
+    report['train_score'] = train_score
+    report['test_score'] = test_score
     
-    print(f"Water Safety Model - Train Score: {train_score:.3f}, Test Score: {test_score:.3f}")
+    print(f"{name} - Train Score: {train_score:.3f}, Test Score: {test_score:.3f}")
     
-    # Save model and scaler
-    joblib.dump(model, 'water_safety_model.pkl')
-    joblib.dump(scaler, 'water_safety_scaler.pkl')
+    # Export the flat-array forest used on the prediction hot path
+    start = time.perf_counter()
+    compiled = compile_forest(model, scaler)
+    sample = X_test
+    if len(X_test) > PARITY_CHECK_ROWS:
+        sample = X_test[np.random.default_rng(42).choice(len(X_test), PARITY_CHECK_ROWS, replace=False)]
+    check_parity(compiled, model, scaler, sample)
+    report['compile_seconds'] = time.perf_counter() - start
+    report['parity_rows'] = len(sample)
+    
+    return model, scaler, compiled
+
+def train_water_safety_model(n_samples=1000, n_estimators=100, max_depth=None, n_jobs=None, output_dir=MODEL_DIR, report=None):
+    """Train water safety prediction model"""
+    report = {} if report is None else report
+    report.update(samples=n_samples, n_estimators=n_estimators, max_depth=max_depth, n_jobs=n_jobs)
+
+    print("Generating water safety training data...")
+    start = time.perf_counter()
+    data = generate_water_safety_data(n_samples)
+    report['generate_seconds'] = time.perf_counter() - start
+    
+    X = data[:, :-2]  # Features: temperature, ph, turbidity, tds
+    y = data[:, -2]   # Target: is_unsafe (0 or 1)
+    
+    model, scaler, compiled = _fit_forest("Water Safety Model", X, y, n_estimators, max_depth, n_jobs, report)
+    
+    # Save model, scaler and compiled export
+    _save_artifacts(
+        output_dir,
+        {'water_safety_model.pkl': model, 'water_safety_scaler.pkl': scaler},
+        {'water_safety_compiled.npz': compiled},
+        report,
+    )
     
     return model, scaler
 
-def train_disease_prediction_model():
+def train_disease_prediction_model(n_samples=800, n_estimators=100, max_depth=None, n_jobs=None, output_dir=MODEL_DIR, report=None):
     """Train disease prediction model"""
+    report = {} if report is None else report
+    report.update(samples=n_samples, n_estimators=n_estimators, max_depth=max_depth, n_jobs=n_jobs)
+
     print("Generating disease prediction training data...")
-    data, diseases = generate_disease_data()
+    start = time.perf_counter()
+    data, diseases = generate_disease_data(n_samples)
+    report['generate_seconds'] = time.perf_counter() - start
     
     X = data[:, :-1]  # Features: temperature, ph, turbidity, tds
     y = data[:, -1]   # Target: disease index
     
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    model, scaler, compiled = _fit_forest("Disease Prediction Model", X, y, n_estimators, max_depth, n_jobs, report)
     
-    # Scale features
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
-    
-    # Train model
-    model = RandomForestClassifier(n_estimators=100, random_state=42)
-    model.fit(X_train_scaled, y_train)
-    
-    # Evaluate
-    train_score = model.score(X_train_scaled, y_train)
-    test_score = model.score(X_test_scaled, y_test)
-    
-    print(f"Disease Prediction Model - Train Score: {train_score:.3f}, Test Score: {test_score:.3f}")
-    
-    # Save model and scaler
-    joblib.dump(model, 'disease_model.pkl')
-    joblib.dump(scaler, 'disease_scaler.pkl')
-    joblib.dump(diseases, 'disease_labels.pkl')
+    # Save model, scaler, labels and compiled export
+    _save_artifacts(
+        output_dir,
+        {'disease_model.pkl': model, 'disease_scaler.pkl': scaler, 'disease_labels.pkl': diseases},
+        {'disease_compiled.npz': compiled},
+        report,
+    )
     
     return model, scaler, diseases
 
-def predict_water_safety(temperature, ph, turbidity, tds):
-    """Predict water safety using trained model"""
-    try:
-        model = joblib.load('water_safety_model.pkl')
-        scaler = joblib.load('water_safety_scaler.pkl')
-        
-        # Prepare input
-        X = np.array([[temperature, ph, turbidity, tds]])
-        X_scaled = scaler.transform(X)
-        
-        # Predict
-        prediction = model.predict(X_scaled)[0]
-        probabilities = model.predict_proba(X_scaled)[0]
-        
+def train_models(output_dir=MODEL_DIR, safety_samples=1000, disease_samples=800, n_estimators=100,
+                 max_depth=None, safety_jobs=None, disease_jobs=None, parallel=True):
+    """Train both models into a new version directory and publish it.
+
+    Artifacts go to <output_dir>/versions/<version>/, and once the set is
+    complete the CURRENT pointer is swapped to it, so the registry moves
+    from one full set to the next. Returns the timing/size report, which is
+    also saved as JSON next to the versioned artifacts.
+    """
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    version_dir = os.path.join(output_dir, "versions", version)
+    reports = {'water_safety': {}, 'disease': {}}
+    jobs = [
+        (train_water_safety_model, safety_samples, safety_jobs, reports['water_safety']),
+        (train_disease_prediction_model, disease_samples, disease_jobs, reports['disease']),
+    ]
+
+    start = time.perf_counter()
+    # Forest fitting releases the GIL, so two threads keep both models busy
+    with ThreadPoolExecutor(max_workers=2 if parallel else 1) as pool:
+        futures = [
+            pool.submit(train, n_samples, n_estimators, max_depth, n_jobs, version_dir, report)
+            for train, n_samples, n_jobs, report in jobs
+        ]
+        for future in futures:
+            future.result()
+    train_seconds = time.perf_counter() - start
+
+    report = {
+        'version': version,
+        'output_dir': os.path.abspath(output_dir),
+        'parallel': parallel,
+        'train_seconds': train_seconds,
+        'models': reports,
+    }
+    def write_report(tmp):
+        with open(tmp, 'w') as f:
+            json.dump(report, f, indent=2)
+    _write_artifact(write_report, version_dir, 'training_report.json')
+    publish_version(output_dir, version)
+    return report
+
+def _parse_training_args(argv=None):
+    half_cores = max(1, (os.cpu_count() or 2) // 2)
+    parser = argparse.ArgumentParser(description="Train the water safety and disease prediction models")
+    parser.add_argument("--output-dir", default=MODEL_DIR, help="directory the API loads models from")
+    parser.add_argument("--safety-samples", type=int, default=1000, help="synthetic rows for the water safety model")
+    parser.add_argument("--disease-samples", type=int, default=800, help="synthetic rows for the disease model")
+    parser.add_argument("--trees", type=int, default=100, help="n_estimators for both forests")
+    parser.add_argument("--max-depth", type=int, default=None, help="max_depth for both forests (default: unlimited)")
+    parser.add_argument("--safety-jobs", type=int, default=half_cores, help="n_jobs for the water safety forest")
+    parser.add_argument("--disease-jobs", type=int, default=half_cores, help="n_jobs for the disease forest")
+    parser.add_argument("--sequential", action="store_true", help="train the models one after the other")
+    parser.add_argument("--report", help="also write the JSON report to this path")
+    parser.add_argument("--publish", metavar="VERSION", help="serve an already trained version (e.g. roll back) instead of training")
+    return parser.parse_args(argv)
+
+class ModelSnapshot:
+    """One consistent set of loaded artifacts and the version they came from"""
+
+    def __init__(self, artifacts, version):
+        self.safety_model = artifacts['safety_model']
+        self.safety_scaler = artifacts['safety_scaler']
+        self.disease_model = artifacts['disease_model']
+        self.disease_scaler = artifacts['disease_scaler']
+        self.disease_labels = artifacts['disease_labels']
+        self.safety_compiled = artifacts['safety_compiled']
+        self.disease_compiled = artifacts['disease_compiled']
+        self.version = version
+        self.loaded_at = time.time()
+
+class ModelRegistry:
+    """Keeps the trained artifacts resident and swaps them when the files change.
+
+    Readers always get a complete ModelSnapshot; a reload builds the new
+    snapshot on the side and replaces the reference in one assignment, so a
+    prediction never mixes a new model with an old scaler.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, reload_interval=MODEL_RELOAD_INTERVAL):
+        self.model_dir = model_dir
+        self.reload_interval = reload_interval
+        self._snapshot = None
+        self._fingerprint = None
+        self._last_check = 0.0
+        self._reload_lock = threading.Lock()
+
+    def _current_fingerprint(self):
+        """(artifact directory, fingerprint of the files in it)"""
+        directory = resolve_model_dir(self.model_dir)
+        fingerprint = [('dir', directory)]
+        for key, filename in sorted(MODEL_ARTIFACTS.items()):
+            st = os.stat(os.path.join(directory, filename))
+            fingerprint.append((key, st.st_mtime_ns, st.st_size))
+        # The compiled exports are optional, older model directories only have pickles
+        for key, (filename, _, _) in sorted(COMPILED_ARTIFACTS.items()):
+            try:
+                st = os.stat(os.path.join(directory, filename))
+                fingerprint.append((key, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                fingerprint.append((key, None, None))
+        return directory, tuple(fingerprint)
+
+    def _load(self, directory, fingerprint):
+        artifacts = {
+            key: joblib.load(os.path.join(directory, filename))
+            for key, filename in MODEL_ARTIFACTS.items()
+        }
+        for key, (filename, model_key, scaler_key) in COMPILED_ARTIFACTS.items():
+            path = os.path.join(directory, filename)
+            model_path = os.path.join(directory, MODEL_ARTIFACTS[model_key])
+            # Use the export only if it was written after the pickle it came from,
+            # otherwise compile the forest we just loaded
+            if os.path.exists(path) and os.stat(path).st_mtime_ns >= os.stat(model_path).st_mtime_ns:
+                artifacts[key] = CompiledForest.load(path)
+            else:
+                artifacts[key] = compile_forest(artifacts[model_key], artifacts[scaler_key])
+        version = hashlib.sha1(repr(fingerprint).encode()).hexdigest()[:12]
+        return ModelSnapshot(artifacts, version)
+
+    def _refresh(self):
+        directory, fingerprint = self._current_fingerprint()
+        if fingerprint == self._fingerprint:
+            return
+        snapshot = self._load(directory, fingerprint)
+        # A new version may have been published while we were unpickling; only
+        # publish the snapshot if it still matches what is on disk
+        if self._current_fingerprint()[1] != fingerprint:
+            return
+        previous = self._snapshot
+        self._snapshot = snapshot
+        self._fingerprint = fingerprint
+        if previous is not None:
+            print(f"Reloaded ML models: {previous.version} -> {snapshot.version}")
+
+    def get(self):
+        """Return the current snapshot, reloading it if the files changed"""
+        now = time.monotonic()
+        if self._snapshot is not None and now - self._last_check < self.reload_interval:
+            return self._snapshot
+
+        if self._snapshot is None:
+            # Nothing to serve yet, every caller has to wait for the first load
+            with self._reload_lock:
+                if self._snapshot is None:
+                    self._refresh()
+                    self._last_check = time.monotonic()
+            return self._snapshot
+
+        # Only one thread checks the disk; the others keep serving the
+        # snapshot they already have
+        if self._reload_lock.acquire(blocking=False):
+            try:
+                self._last_check = now
+                self._refresh()
+            except Exception as e:
+                print(f"Error reloading ML models, keeping {self._snapshot.version}: {e}")
+            finally:
+                self._reload_lock.release()
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self._snapshot.version if self._snapshot is not None else None
+
+    def warm_up(self):
+        """Load every artifact and push one row through each model"""
+        snapshot = self.get()
+        X = np.array([[25.0, 7.0, 2.0, 300.0]])
+        snapshot.safety_compiled.predict_proba(X)
+        snapshot.disease_compiled.predict_proba(X)
+        return snapshot.version
+
+FEATURE_NAMES = ['temperature', 'ph', 'turbidity', 'tds']
+# Resolution the probes report at; readings closer than this share a prediction
+FEATURE_PRECISION = np.array([0.1, 0.01, 0.01, 1.0])
+
+def _as_feature_matrix(features):
+    """Turn rows or a {feature: column} dict into an (N, 4) float array"""
+    n_features = len(FEATURE_NAMES)
+    if isinstance(features, dict):
+        missing = [name for name in FEATURE_NAMES if name not in features]
+        if missing:
+            raise ValueError(f"Missing feature columns: {', '.join(missing)}")
+        columns = [np.asarray(features[name], dtype=float) for name in FEATURE_NAMES]
+        if any(column.ndim != 1 for column in columns) or len({len(column) for column in columns}) != 1:
+            raise ValueError("Feature columns must be flat lists of the same length")
+        return np.column_stack(columns) if len(columns[0]) else np.empty((0, n_features))
+    X = np.asarray(features, dtype=float)
+    if X.size == 0:
+        return np.empty((0, n_features))
+    # Never reshape: a row with a missing feature must not shift the rows after it
+    if X.ndim != 2 or X.shape[1] != n_features:
+        raise ValueError(f"Expected rows of {n_features} features ({', '.join(FEATURE_NAMES)}), got shape {X.shape}")
+    return X
+
+def _water_safety_results(snapshot, X):
+    """Score every row of X with the safety model in one pass"""
+    forest = snapshot.safety_compiled
+    if len(X) <= COMPILED_MAX_ROWS:
+        probabilities = forest.predict_proba(X)
+    else:
+        probabilities = snapshot.safety_model.predict_proba(snapshot.safety_scaler.transform(X))
+    predictions = forest.classes.take(np.argmax(probabilities, axis=1))
+    confidences = probabilities.max(axis=1)
+
+    results = []
+    for prediction, confidence in zip(predictions, confidences):
         is_safe = prediction == 0
-        confidence = max(probabilities)
-        
-        return {
+        results.append({
             'is_safe': bool(is_safe),
             'confidence': float(confidence),
-            'risk_level': 'Low' if is_safe else 'High'
-        }
-    except Exception as e:
-        print(f"Error in water safety prediction: {e}")
-        # Fallback to rule-based prediction
-        unsafe = ph < 6.5 or ph > 8.5 or turbidity > 10 or tds > 500
-        return {
-            'is_safe': not unsafe,
-            'confidence': 0.85,
-            'risk_level': 'Low' if not unsafe else 'High'
-        }
+            'risk_level': 'Low' if is_safe else 'High',
+            'model_version': snapshot.version
+        })
+    return results
 
-def predict_disease(temperature, ph, turbidity, tds):
-    """Predict potential diseases using trained model"""
-    try:
-        model = joblib.load('disease_model.pkl')
-        scaler = joblib.load('disease_scaler.pkl')
-        diseases = joblib.load('disease_labels.pkl')
-        
-        # Prepare input
-        X = np.array([[temperature, ph, turbidity, tds]])
-        X_scaled = scaler.transform(X)
-        
-        # Predict
-        prediction = model.predict(X_scaled)[0]
-        probabilities = model.predict_proba(X_scaled)[0]
-        
-        disease = diseases[int(prediction)]
-        confidence = max(probabilities)
-        
-        # Get top 3 predictions
-        top_indices = np.argsort(probabilities)[-3:][::-1]
+def _disease_results(snapshot, X):
+    """Score every row of X with the disease model in one pass"""
+    forest = snapshot.disease_compiled
+    diseases = snapshot.disease_labels
+    if len(X) <= COMPILED_MAX_ROWS:
+        probabilities = forest.predict_proba(X)
+    else:
+        probabilities = snapshot.disease_model.predict_proba(snapshot.disease_scaler.transform(X))
+    predictions = forest.classes.take(np.argmax(probabilities, axis=1))
+    confidences = probabilities.max(axis=1)
+
+    # Top 3 column indices per row, most likely first
+    top_indices = np.argsort(probabilities, axis=1)[:, -3:][:, ::-1]
+
+    results = []
+    for row, prediction in enumerate(predictions):
         top_predictions = [
             {
-                'disease': diseases[idx],
-                'probability': float(probabilities[idx])
+                'disease': diseases[int(forest.classes[idx])],
+                'probability': float(probabilities[row, idx])
             }
-            for idx in top_indices
+            for idx in top_indices[row]
         ]
-        
-        return {
-            'predicted_disease': disease,
-            'confidence': float(confidence),
-            'top_predictions': top_predictions
-        }
-    except Exception as e:
-        print(f"Error in disease prediction: {e}")
-        # Fallback to rule-based prediction
-        if turbidity > 8 and ph < 6.5:
-            disease = "Gastroenteritis"
-        elif turbidity > 15 and temperature > 30:
-            disease = "Cholera"
-        elif tds > 800 and temperature > 28:
-            disease = "Typhoid"
-        elif ph < 6.0 and temperature > 32:
-            disease = "Hepatitis A"
-        elif turbidity > 10 and tds > 600:
-            disease = "Dysentery"
-        elif ph < 5.5 or ph > 9.0:
-            disease = "Skin Infection"
-        else:
-            disease = "No Disease"
-            
-        return {
-            'predicted_disease': disease,
-            'confidence': 0.75,
-            'top_predictions': [
-                {'disease': disease, 'probability': 0.75},
-                {'disease': 'No Disease', 'probability': 0.15},
-                {'disease': 'Gastroenteritis', 'probability': 0.10}
-            ]
+        results.append({
+            'predicted_disease': diseases[int(prediction)],
+            'confidence': float(confidences[row]),
+            'top_predictions': top_predictions,
+            'model_version': snapshot.version
+        })
+    return results
+
+def _rule_based_safety_results(X):
+    """Fallback safety predictions from the alert rules: unsafe means a danger rule fires"""
+    danger = alert_rules.evaluate(X) >= LEVELS.index('danger')
+    return [
+        {
+            'is_safe': not unsafe,
+            'confidence': 0.85,
+            'risk_level': 'Low' if not unsafe else 'High',
+            'model_version': 'rule-based'
         }
+        for unsafe in danger.tolist()
+    ]
+
+def rule_based_water_safety(temperature, ph, turbidity, tds):
+    """Fallback safety prediction used when the model can't be run"""
+    return _rule_based_safety_results([[temperature, ph, turbidity, tds]])[0]
+
+def rule_based_disease(temperature, ph, turbidity, tds):
+    """Fallback disease prediction used when the model can't be run"""
+    if turbidity > 8 and ph < 6.5:
+        disease = "Gastroenteritis"
+    elif turbidity > 15 and temperature > 30:
+        disease = "Cholera"
+    elif tds > 800 and temperature > 28:
+        disease = "Typhoid"
+    elif ph < 6.0 and temperature > 32:
+        disease = "Hepatitis A"
+    elif turbidity > 10 and tds > 600:
+        disease = "Dysentery"
+    elif ph < 5.5 or ph > 9.0:
+        disease = "Skin Infection"
+    else:
+        disease = "No Disease"
+
+    return {
+        'predicted_disease': disease,
+        'confidence': 0.75,
+        'top_predictions': [
+            {'disease': disease, 'probability': 0.75},
+            {'disease': 'No Disease', 'probability': 0.15},
+            {'disease': 'Gastroenteritis', 'probability': 0.10}
+        ],
+        'model_version': 'rule-based'
+    }
+
+class PredictionCache:
+    """LRU of model results keyed on the reading rounded to FEATURE_PRECISION.
+
+    Entries belong to one model version; the first lookup against a new
+    version empties the cache. Cached result dicts are shared, treat them as
+    read-only.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def quantize(X):
+        """Integer grid coordinates of every row, one hashable key per row"""
+        return [tuple(row) for row in np.rint(X / FEATURE_PRECISION).astype(np.int64).tolist()]
+
+    @staticmethod
+    def dequantize(keys):
+        return np.array(keys, dtype=float).reshape(-1, len(FEATURE_NAMES)) * FEATURE_PRECISION
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = version
+
+    def get_many(self, version, keys):
+        """Cached result per key, None where missing"""
+        with self._lock:
+            self._check_version(version)
+            results = []
+            for key in keys:
+                result = self._entries.get(key)
+                if result is not None:
+                    self._entries.move_to_end(key)
+                results.append(result)
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(keys) - hits
+            return results
+
+    def put_many(self, version, keys, results):
+        with self._lock:
+            self._check_version(version)
+            for key, result in zip(keys, results):
+                self._entries[key] = result
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'model_version': self._version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+class InferencePipeline:
+    """Single entry point for safety + disease inference.
+
+    Features are validated and converted to one float matrix, both models
+    score it against the same registry snapshot, and any failure falls back
+    to the rule-based predictions for the whole call. With a cache, readings
+    are rounded to FEATURE_PRECISION and only distinct rounded readings the
+    cache hasn't seen for this model version reach the forests.
+    """
+
+    def __init__(self, registry, cache=None):
+        self.registry = registry
+        self.cache = cache
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.rows = 0
+        self.fallbacks = 0
+        self.seconds = 0.0
+
+    @staticmethod
+    def to_features(features):
+        """Validate rows or a {feature: column} dict into an (N, 4) float array"""
+        X = _as_feature_matrix(features)
+        if not np.isfinite(X).all():
+            raise ValueError("Sensor readings must be finite numbers")
+        return X
+
+    def _fallback(self, X):
+        return [
+            {'water_safety': safety, 'disease_prediction': rule_based_disease(*map(float, row))}
+            for safety, row in zip(_rule_based_safety_results(X), X)
+        ]
+
+    def predict_many(self, features):
+        """Score many readings, results in input order.
+
+        `features` is either a sequence of [temperature, ph, turbidity, tds]
+        rows or a dict of equal-length columns keyed by those names. Returns
+        one {'water_safety': ..., 'disease_prediction': ...} dict per row.
+        """
+        X = self.to_features(features)
+        if len(X) == 0:
+            return []
+
+        start = time.perf_counter()
+        fell_back = False
+        try:
+            snapshot = self.registry.get()
+            if self.cache is None:
+                results = self._score(snapshot, X)
+            else:
+                results = self._score_cached(snapshot, X)
+        except Exception as e:
+            print(f"Error in ML prediction, using rule-based fallback: {e}")
+            results = self._fallback(X)
+            fell_back = True
+
+        with self._lock:
+            self.calls += 1
+            self.rows += len(X)
+            self.fallbacks += int(fell_back)
+            self.seconds += time.perf_counter() - start
+        return results
+
+    @staticmethod
+    def _score(snapshot, X):
+        return [
+            {'water_safety': safety, 'disease_prediction': disease}
+            for safety, disease in zip(_water_safety_results(snapshot, X), _disease_results(snapshot, X))
+        ]
+
+    def _score_cached(self, snapshot, X):
+        # Values past the integer grid (bogus readings) aren't worth caching
+        if not (np.abs(X) < 1e12).all():
+            return self._score(snapshot, X)
+        keys = self.cache.quantize(X)
+        results = self.cache.get_many(snapshot.version, keys)
+        missing = list(dict.fromkeys(key for key, result in zip(keys, results) if result is None))
+        if missing:
+            scored = dict(zip(missing, self._score(snapshot, self.cache.dequantize(missing))))
+            self.cache.put_many(snapshot.version, missing, [scored[key] for key in missing])
+            results = [scored[key] if result is None else result for key, result in zip(keys, results)]
+        return [dict(result) for result in results]
+
+    def predict(self, temperature, ph, turbidity, tds):
+        """Score one reading with both models"""
+        return self.predict_many([[temperature, ph, turbidity, tds]])[0]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'model_version': self.registry.version,
+                'calls': self.calls,
+                'rows': self.rows,
+                'fallbacks': self.fallbacks,
+                'avg_ms_per_call': (self.seconds / self.calls * 1000) if self.calls else 0.0,
+                'cache': self.cache.stats() if self.cache is not None else None
+            }
+
+registry = ModelRegistry()
+pipeline = InferencePipeline(registry, PredictionCache(PREDICTION_CACHE_SIZE) if PREDICTION_CACHE_SIZE > 0 else None)
+
+def predict_water_safety(temperature, ph, turbidity, tds):
+    """Predict water safety using trained model"""
+    return pipeline.predict(temperature, ph, turbidity, tds)['water_safety']
+
+def predict_disease(temperature, ph, turbidity, tds):
+    """Predict potential diseases using trained model"""
+    return pipeline.predict(temperature, ph, turbidity, tds)['disease_prediction']
+
+def predict_batch(features):
+    """Predict water safety and disease for many readings at once"""
+    return pipeline.predict_many(features)
 
 if __name__ == "__main__":
+    args = _parse_training_args()
+    if args.publish:
+        publish_version(args.output_dir, args.publish)
+        print(f"Now serving model version {args.publish}")
+        raise SystemExit(0)
     print("Training ML models for water quality prediction...")
     
-    # Train water safety model
-    safety_model, safety_scaler = train_water_safety_model()
-    
-    # Train disease prediction model
-    disease_model, disease_scaler, diseases = train_disease_prediction_model()
+    report = train_models(
+        output_dir=args.output_dir,
+        safety_samples=args.safety_samples,
+        disease_samples=args.disease_samples,
+        n_estimators=args.trees,
+        max_depth=args.max_depth,
+        safety_jobs=args.safety_jobs,
+        disease_jobs=args.disease_jobs,
+        parallel=not args.sequential,
+    )
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
     
-    print("Models trained and saved successfully!")
+    print(f"Models trained and saved successfully! (version {report['version']})")
+    print(json.dumps(report, indent=2))
     
     # Test predictions
     print("\nTesting predictions...")
     test_data = [25.0, 7.2, 3.5, 280]  # temperature, ph, turbidity, tds
     
-    safety_result = predict_water_safety(*test_data)
-    disease_result = predict_disease(*test_data)
+    result = InferencePipeline(ModelRegistry(args.output_dir)).predict(*test_data)
     
-    print(f"Water Safety: {safety_result}")
-    print(f"Disease Prediction: {disease_result}")
+    print(f"Water Safety: {result['water_safety']}")
+    print(f"Disease Prediction: {result['disease_prediction']}")